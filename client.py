@@ -5,8 +5,23 @@ This module provides a client for making streaming requests to a local LLM serve
 It handles Server-Sent Events (SSE) and displays the streamed response.
 """
 
+import struct
+import sys
 import requests
-import json
+from requests.adapters import HTTPAdapter
+
+# orjson parses UTF-8 bytes directly; fall back to stdlib json if unavailable
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+# SSE framing constants, matched on raw bytes
+_SSE_PREFIX = b"data:"
+_SSE_DONE = b"data: [DONE]"
+
+# Binary mode (?binary=1) frame header: 4-byte big-endian content length
+_FRAME_HEADER = struct.Struct("!I")
 
 
 class ClientTest:
@@ -21,19 +36,77 @@ class ClientTest:
         """
         self.server_url = server_url
         self.headers = {"Content-Type": "application/json"}
+        
+        # Reuse one keep-alive connection pool for all requests
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        # httpx client for send_request_async, created on first use
+        self._client = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
-    def send_request(self, prompt, model="test"):
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+    
+    def close(self):
+        """Close the underlying HTTP session and release pooled connections."""
+        self.session.close()
+    
+    async def aclose(self):
+        """Close both the sync session and the async httpx client."""
+        self.close()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def _get_async_client(self):
+        """
+        Lazily create the shared httpx.AsyncClient.
+        
+        HTTP/2 multiplexes concurrent streams over one connection; it needs the
+        optional `h2` package, so fall back to HTTP/1.1 pooling without it.
+        """
+        if self._client is None:
+            import httpx
+            
+            limits = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+            try:
+                self._client = httpx.AsyncClient(
+                    http2=True, limits=limits, headers=self.headers, timeout=None
+                )
+            except ImportError:
+                self._client = httpx.AsyncClient(
+                    limits=limits, headers=self.headers, timeout=None
+                )
+        return self._client
+    
+    def send_request(self, prompt, model="test", binary=False):
         """
         Send a request to the LLM server and process the streaming response.
         
         Args:
             prompt (str): The user's prompt/question
             model (str): The model to use for the request
+            binary (bool): Ask the server for length-prefixed binary frames
+                instead of SSE (less framing for local simulation)
             
         Returns:
             str: The complete response text
         """
         url = f"{self.server_url}/chat/completions"
+        if binary:
+            url += "?binary=1"
         request_data = {
             "model": model,
             "messages": [
@@ -46,61 +119,249 @@ class ClientTest:
         
         try:
             # Make streaming request
-            response = requests.post(
+            response = self.session.post(
                 url, 
-                headers=self.headers, 
                 json=request_data, 
                 stream=True
             )
             response.raise_for_status()
             
             # Process the streaming response
-            return self._process_stream(response)
+            return self._process_stream(response, binary=binary)
             
         except requests.exceptions.RequestException as e:
             print(f"Request failed: {e}")
             return None
     
-    def _process_stream(self, response):
+    async def send_request_async(self, prompt, model="test"):
+        """
+        Async variant of send_request for fanning out many prompts at once.
+        
+        Example:
+            async with ClientTest() as client:
+                await asyncio.gather(*(client.send_request_async(p, m) for p, m in pairs))
+        
+        Args:
+            prompt (str): The user's prompt/question
+            model (str): The model to use for the request
+            
+        Returns:
+            str: The complete response text
+        """
+        import httpx
+        
+        url = f"{self.server_url}/chat/completions"
+        request_data = {
+            "model": model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        }
+        
+        try:
+            async with self._get_async_client().stream("POST", url, json=request_data) as response:
+                response.raise_for_status()
+                return await self._process_stream_async(response)
+                
+        except httpx.HTTPError as e:
+            print(f"Request failed: {e}")
+            return None
+    
+    def _process_stream(self, response, binary=False):
         """
         Process a streaming response from the server.
         
         Args:
             response: The streaming response object
+            binary (bool): Whether the body uses binary frames instead of SSE
             
         Returns:
             str: The complete accumulated response
         """
-        accumulated_text = ""
+        chunks = []
         
-        for line in response.iter_lines():
-            if not line:
-                continue
-                
-            decoded_line = line.decode('utf-8')
-            if not decoded_line.startswith("data:"):
-                continue
-                
-            try:
-                # Parse the JSON data (remove "data: " prefix)
-                json_data = json.loads(decoded_line[5:])
-                
-                if "choices" in json_data and json_data["choices"]:
-                    content = json_data["choices"][0]["delta"].get("content", "")
-                    if content:
-                        accumulated_text += content
-                        print(content, end="", flush=True)
-                        
-            except json.decoder.JSONDecodeError:
-                print(f"Error decoding JSON: {decoded_line}")
+        # Flush stdout every ~256 chars instead of once per token
+        write = sys.stdout.write
+        flush = sys.stdout.flush
+        buf_len = 0
+        
+        contents = _iter_frames(response) if binary else self._iter_sse_content(response)
+        for content in contents:
+            if content:
+                chunks.append(content)
+                write(content)
+                buf_len += len(content)
+                if buf_len >= 256:
+                    flush()
+                    buf_len = 0
         
-        print()  # Add a newline at the end
-        return accumulated_text
+        write("\n")  # Add a newline at the end
+        flush()
+        return "".join(chunks)
+    
+    def _iter_sse_content(self, response):
+        """
+        Yield the delta content of each SSE line until [DONE].
+        
+        Args:
+            response: The streaming response object
+            
+        Yields:
+            str: Delta content, or None for lines that carry none
+        """
+        for line in _iter_lines(response):
+            if line == _SSE_DONE:
+                break
+            yield self._parse_line(line)
+    
+    async def _process_stream_async(self, response):
+        """
+        Async counterpart of _process_stream for an httpx streaming response.
+        
+        Args:
+            response: The httpx streaming response object
+            
+        Returns:
+            str: The complete accumulated response
+        """
+        chunks = []
+        
+        write = sys.stdout.write
+        flush = sys.stdout.flush
+        buf_len = 0
+        
+        async for line in _aiter_lines(response):
+            if line == _SSE_DONE:
+                break
+            content = self._parse_line(line)
+            if content:
+                chunks.append(content)
+                write(content)
+                buf_len += len(content)
+                if buf_len >= 256:
+                    flush()
+                    buf_len = 0
+        
+        write("\n")
+        flush()
+        return "".join(chunks)
+    
+    def _parse_line(self, line):
+        """
+        Extract the delta content from a single SSE line.
+        
+        Args:
+            line (bytes): One raw line of the event stream
+            
+        Returns:
+            str: The delta content, or None if the line carries none
+        """
+        if not line.startswith(_SSE_PREFIX):
+            return None
+        
+        # Role-only deltas carry no content; a bytes scan is far cheaper
+        # than parsing them
+        if b'"content"' not in line:
+            return None
+            
+        try:
+            # Parse the JSON payload; the space after "data:" is optional
+            json_data = _json.loads(line[len(_SSE_PREFIX):].lstrip())
+        except _json.JSONDecodeError:
+            print(f"Error decoding JSON: {line.decode('utf-8', errors='replace')}")
+            return None
+        
+        # Fixed OpenAI delta shape: index directly instead of checking each level
+        try:
+            return json_data["choices"][0]["delta"]["content"]
+        except (KeyError, IndexError, TypeError):
+            return None
+
+
+def _iter_lines(response, chunk_size=8192):
+    """
+    Split a streaming response into raw byte lines.
+    
+    Lighter than response.iter_lines(): reads large chunks and keeps only a
+    small tail buffer, so the stream stays in bytes until JSON parsing.
+    
+    Args:
+        response: The streaming response object
+        chunk_size (int): Number of bytes to read per chunk
+        
+    Yields:
+        bytes: One line without its trailing newline
+    """
+    buf = bytearray()
+    for chunk in response.iter_content(chunk_size=chunk_size, decode_unicode=False):
+        buf += chunk
+        start = 0
+        while (nl := buf.find(b"\n", start)) != -1:
+            yield bytes(buf[start:nl]).rstrip(b"\r")
+            start = nl + 1
+        del buf[:start]
+    
+    if buf:
+        yield bytes(buf).rstrip(b"\r")
+
+
+def _iter_frames(response, chunk_size=8192):
+    """
+    Split a binary-mode response into its length-prefixed text frames.
+    
+    Args:
+        response: The streaming response object
+        chunk_size (int): Number of bytes to read per chunk
+        
+    Yields:
+        str: The content of one frame
+    """
+    header_size = _FRAME_HEADER.size
+    buf = bytearray()
+    for chunk in response.iter_content(chunk_size=chunk_size, decode_unicode=False):
+        buf += chunk
+        start = 0
+        while len(buf) - start >= header_size:
+            (length,) = _FRAME_HEADER.unpack_from(buf, start)
+            end = start + header_size + length
+            if end > len(buf):
+                break
+            yield buf[start + header_size:end].decode("utf-8")
+            start = end
+        del buf[:start]
+
+
+async def _aiter_lines(response):
+    """
+    Async counterpart of _iter_lines for an httpx streaming response.
+    
+    Bytes are consumed as they arrive; a sized aiter_bytes() would hold
+    lines back until a whole chunk had been received.
+    
+    Args:
+        response: The httpx streaming response object
+        
+    Yields:
+        bytes: One line without its trailing newline
+    """
+    buf = bytearray()
+    async for chunk in response.aiter_bytes():
+        buf += chunk
+        start = 0
+        while (nl := buf.find(b"\n", start)) != -1:
+            yield bytes(buf[start:nl]).rstrip(b"\r")
+            start = nl + 1
+        del buf[:start]
+    
+    if buf:
+        yield bytes(buf).rstrip(b"\r")
 
 
 def main():
     """Main function to demonstrate the LLM client."""
-    client = ClientTest()
     prompt = r"""在直三棱柱ABC-A_1B_1C_1中，D，E分别为AA_1，AC的中点，且AB=BC=1，AA_1=AC=\sqrt{3}
 求二面角B-CD-A_1的正弦值"""
     # model = "gemini-2.0-flash-001"
@@ -112,7 +373,8 @@ def main():
     # model = "ark-deepseek-r1-250120 slow"
     
     print(f"Sending prompt: {prompt}")
-    client.send_request(prompt, model)
+    with ClientTest() as client:
+        client.send_request(prompt, model)
 
 
 if __name__ == "__main__":
@@ -1,30 +1,228 @@
 import sqlite3
-import json
 import os
+import threading
+import weakref
+from contextlib import contextmanager
 from datetime import datetime
 
+# Prefer orjson for metadata (de)serialization; fall back to stdlib json
+try:
+    import orjson
+
+    def _dumps(obj):
+        return orjson.dumps(obj).decode('utf-8')
+
+    _loads = orjson.loads
+except ImportError:
+    import json
+
+    _dumps = json.dumps
+    _loads = json.loads
+
+# Hot-path SQL kept as module constants so every call hands sqlite3's
+# statement cache the same string object
+_INSERT_CONV_SQL = "INSERT INTO conversations (model_name, prompt, response, metadata) VALUES (?, ?, ?, ?)"
+_INSERT_CONV_TS_SQL = "INSERT INTO conversations (model_name, prompt, response, metadata, timestamp) VALUES (?, ?, ?, ?, ?)"
+_INSERT_USAGE_SQL = """
+    INSERT INTO token_usage (
+        conversation_id, input_tokens, output_tokens, total_tokens,
+        reasoning_tokens, accepted_prediction_tokens, rejected_prediction_tokens,
+        execution_time
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+# Columns returned for a conversation: the row plus its token usage
+_CONV_COLUMNS = """
+    SELECT c.*, t.input_tokens, t.output_tokens, t.total_tokens,
+           t.reasoning_tokens, t.accepted_prediction_tokens, t.rejected_prediction_tokens,
+           t.execution_time
+"""
+_GET_CONV_SQL = _CONV_COLUMNS + """
+    FROM conversations c
+    LEFT JOIN token_usage t ON c.id = t.conversation_id
+    WHERE c.id = ?
+"""
+_LIST_CONV_SQL = _CONV_COLUMNS + """
+    FROM conversations c
+    LEFT JOIN token_usage t ON c.id = t.conversation_id
+    ORDER BY c.timestamp DESC, c.id DESC
+    LIMIT ? OFFSET ?
+"""
+_SEARCH_FTS_SQL = _CONV_COLUMNS + """
+    FROM conversations_fts f
+    JOIN conversations c ON c.id = f.rowid
+    LEFT JOIN token_usage t ON c.id = t.conversation_id
+    WHERE conversations_fts MATCH ?
+    ORDER BY c.timestamp DESC, c.id DESC
+    LIMIT ? OFFSET ?
+"""
+_SEARCH_LIKE_SQL = _CONV_COLUMNS + """
+    FROM conversations c
+    LEFT JOIN token_usage t ON c.id = t.conversation_id
+    WHERE c.prompt LIKE ? OR c.response LIKE ?
+    ORDER BY c.timestamp DESC, c.id DESC
+    LIMIT ? OFFSET ?
+"""
+_FOR_MODEL_FTS_SQL = _CONV_COLUMNS + """
+    FROM conversations_fts f
+    JOIN conversations c ON c.id = f.rowid
+    LEFT JOIN token_usage t ON c.id = t.conversation_id
+    WHERE conversations_fts MATCH ? AND INSTR(?, c.model_name) > 0
+    ORDER BY c.timestamp DESC, c.id DESC
+    LIMIT 1
+"""
+_FOR_MODEL_LIKE_SQL = _CONV_COLUMNS + """
+    FROM conversations c
+    LEFT JOIN token_usage t ON c.id = t.conversation_id
+    WHERE (c.prompt LIKE ? OR c.response LIKE ?) AND INSTR(?, c.model_name) > 0
+    ORDER BY c.timestamp DESC, c.id DESC
+    LIMIT 1
+"""
+
+
+def _fts_phrase(query):
+    """Quote `query` as a single FTS5 phrase so its punctuation is literal."""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _row_to_dict(row):
+    """Convert a conversation row to a dict, decoding its JSON metadata."""
+    conversation = dict(row)
+    if conversation['metadata']:
+        conversation['metadata'] = _loads(conversation['metadata'])
+    return conversation
+
+
+# Connections inherited across fork() (e.g. gunicorn --preload). SQLite
+# forbids using them in the child, and closing one there could checkpoint or
+# delete the WAL behind the parent's back, so the child just keeps them alive.
+_inherited_connections = []
+
+
+class _ThreadConnection:
+    """
+    One thread's connection and cursor.
+    
+    Only the owning thread's threading.local holds a strong reference, so
+    the holder is collected when that thread exits and its connection is
+    closed with it instead of lingering until ConversationDB.close().
+    The opening process's pid is recorded so a forked child opens its own.
+    """
+    
+    __slots__ = ("conn", "cursor", "pid", "__weakref__")
+    
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.pid = os.getpid()
+    
+    def usable(self):
+        """Whether the connection is open and was opened by this process."""
+        return self.conn is not None and self.pid == os.getpid()
+    
+    def close(self):
+        conn, self.conn, self.cursor = self.conn, None, None
+        if conn is None:
+            return
+        if self.pid == os.getpid():
+            conn.close()
+        else:
+            _inherited_connections.append(conn)
+    
+    def __del__(self):
+        self.close()
+
+
 class ConversationDB:
-    def __init__(self, db_path="conversations.db"):
-        """Initialize the database connection and create tables if they don't exist."""
+    def __init__(self, db_path="conversations.db", durability="normal", explicit_timestamp=None):
+        """
+        Initialize the database connection and create tables if they don't exist.
+        
+        Args:
+            db_path (str): Path to the SQLite database file
+            durability (str): "normal" uses synchronous=NORMAL (safe under WAL,
+                may lose the last transactions on power loss); "full" keeps
+                SQLite's default synchronous=FULL
+            explicit_timestamp (bool): Store the client's local wall-clock time
+                (ISO format) instead of relying on the column's
+                CURRENT_TIMESTAMP default (UTC, "YYYY-MM-DD HH:MM:SS").
+                None (default) keeps whichever format the database already
+                uses, so existing databases stay consistently ordered;
+                new databases use CURRENT_TIMESTAMP
+        """
+        if durability not in ("normal", "full"):
+            raise ValueError(f"durability must be 'normal' or 'full', got {durability!r}")
         self.db_path = db_path
-        self.conn = None
-        self.cursor = None
+        self.durability = durability
+        self.explicit_timestamp = explicit_timestamp
+        # Each thread gets its own sqlite connection (see connect()), so an
+        # instance can be shared by worker threads without a Python lock
+        self._local = threading.local()
+        # Live per-thread holders, tracked weakly so close() can reach them
+        # without keeping connections of finished threads alive
+        self._connections = weakref.WeakSet()
+        self._connections_lock = threading.Lock()
         self.connect()
         self.create_tables()
     
+    @property
+    def conn(self):
+        """The calling thread's connection, opened on first use (and after fork)."""
+        holder = getattr(self._local, "holder", None)
+        if holder is None or not holder.usable():
+            return self.connect()
+        return holder.conn
+    
+    @property
+    def cursor(self):
+        """The calling thread's cursor, opened on first use (and after fork)."""
+        holder = getattr(self._local, "holder", None)
+        if holder is None or not holder.usable():
+            self.connect()
+            holder = self._local.holder
+        return holder.cursor
+    
+    @property
+    def _in_bulk(self):
+        return getattr(self._local, "in_bulk", False)
+    
+    @_in_bulk.setter
+    def _in_bulk(self, value):
+        self._local.in_bulk = value
+    
     def connect(self):
-        """Connect to the SQLite database."""
+        """
+        Open a connection to the SQLite database for the calling thread.
+        
+        Returns:
+            sqlite3.Connection: The new connection
+        """
         # Create the database directory if it doesn't exist
         db_dir = os.path.dirname(self.db_path)
-        if db_dir and not os.path.exists(db_dir):
-            os.makedirs(db_dir)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
             
-        self.conn = sqlite3.connect(self.db_path)
+        # Larger statement cache so PRAGMA/DDL don't evict the hot statements.
+        # check_same_thread=False only so close() can release every thread's
+        # connection; each connection is otherwise used by its own thread.
+        conn = sqlite3.connect(self.db_path, cached_statements=256, check_same_thread=False)
         # Enable foreign keys
-        self.conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA foreign_keys = ON")
         # Return rows as dictionaries
-        self.conn.row_factory = sqlite3.Row
-        self.cursor = self.conn.cursor()
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers run alongside the writer and makes commits cheaper
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {self.durability.upper()}")
+        # Wait for a concurrent writer instead of failing with "database is locked"
+        conn.execute("PRAGMA busy_timeout = 5000")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        # Negative value is in KiB: ~20 MB page cache
+        conn.execute("PRAGMA cache_size = -20000")
+        
+        holder = _ThreadConnection(conn)
+        self._local.holder = holder
+        with self._connections_lock:
+            self._connections.add(holder)
+        return conn
     
     def create_tables(self):
         """Create the necessary tables if they don't exist."""
@@ -56,8 +254,109 @@ class ConversationDB:
         )
         ''')
         
+        # Exact-match response cache keyed by a hash of the request parameters
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS response_cache (
+            cache_key TEXT PRIMARY KEY,
+            response TEXT,
+            output_tokens INTEGER,
+            total_tokens INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        
+        self._create_indexes()
+        self.has_fts = self._create_fts()
+        
+        if self.explicit_timestamp is None:
+            self.explicit_timestamp = self._uses_iso_timestamps()
+        
         self.conn.commit()
     
+    def _uses_iso_timestamps(self):
+        """
+        Whether existing rows store ISO local timestamps ("YYYY-MM-DDTHH:MM:SS").
+        
+        Mixing those with CURRENT_TIMESTAMP values would break timestamp
+        ordering ('T' sorts after ' '), so new rows follow the stored format.
+        """
+        self.cursor.execute("SELECT timestamp FROM conversations ORDER BY id DESC LIMIT 1")
+        row = self.cursor.fetchone()
+        return bool(row and row[0] and "T" in str(row[0]))
+    
+    def _create_indexes(self):
+        """Create indexes for the token_usage join, timestamp ordering and per-model stats."""
+        self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_conv_ts'"
+        )
+        existed = self.cursor.fetchone() is not None
+        
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_token_usage_conv ON token_usage(conversation_id)"
+        )
+        # Ascending index scanned backwards yields (timestamp DESC, id DESC), the
+        # order every listing uses; a DESC index would need a sort for the id tiebreak
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_conv_ts ON conversations(timestamp)"
+        )
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_conv_model ON conversations(model_name)"
+        )
+        
+        # Collect planner statistics once, when the indexes are first created
+        if not existed:
+            self.cursor.execute("ANALYZE")
+    
+    def _create_fts(self):
+        """
+        Create the FTS5 index that shadows conversations.prompt/response.
+        
+        The trigram tokenizer keeps substring semantics (same results as
+        LIKE '%q%', including CJK text) while letting SQLite use the index.
+        
+        Returns:
+            bool: False if this SQLite build lacks FTS5/trigram support
+        """
+        self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations_fts'"
+        )
+        existed = self.cursor.fetchone() is not None
+        
+        try:
+            self.cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+                prompt, response,
+                content='conversations', content_rowid='id',
+                tokenize='trigram'
+            )
+            ''')
+        except sqlite3.OperationalError:
+            return False
+        
+        # Keep the external-content index in sync with the conversations table
+        self.cursor.executescript('''
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_ai AFTER INSERT ON conversations BEGIN
+            INSERT INTO conversations_fts(rowid, prompt, response)
+            VALUES (new.id, new.prompt, new.response);
+        END;
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_ad AFTER DELETE ON conversations BEGIN
+            INSERT INTO conversations_fts(conversations_fts, rowid, prompt, response)
+            VALUES ('delete', old.id, old.prompt, old.response);
+        END;
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_au AFTER UPDATE ON conversations BEGIN
+            INSERT INTO conversations_fts(conversations_fts, rowid, prompt, response)
+            VALUES ('delete', old.id, old.prompt, old.response);
+            INSERT INTO conversations_fts(rowid, prompt, response)
+            VALUES (new.id, new.prompt, new.response);
+        END;
+        ''')
+        
+        # Backfill rows written before the index existed
+        if not existed:
+            self.cursor.execute("INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')")
+        
+        return True
+    
     def save_conversation(self, model_name, prompt, response, metadata=None):
         """
         Save a conversation to the database.
@@ -71,15 +370,21 @@ class ConversationDB:
         Returns:
             int: The ID of the inserted conversation
         """
-        metadata_json = json.dumps(metadata) if metadata else None
+        metadata_json = _dumps(metadata) if metadata else None
         
-        self.cursor.execute(
-            "INSERT INTO conversations (model_name, prompt, response, metadata, timestamp) VALUES (?, ?, ?, ?, ?)",
-            (model_name, prompt, response, metadata_json, datetime.now().isoformat())
-        )
+        if self.explicit_timestamp:
+            self.cursor.execute(
+                _INSERT_CONV_TS_SQL,
+                (model_name, prompt, response, metadata_json, datetime.now().isoformat())
+            )
+        else:
+            self.cursor.execute(
+                _INSERT_CONV_SQL,
+                (model_name, prompt, response, metadata_json)
+            )
         
         conversation_id = self.cursor.lastrowid
-        self.conn.commit()
+        self._commit()
         return conversation_id
     
     def save_token_usage(self, conversation_id, input_tokens=0, output_tokens=0, total_tokens=None, 
@@ -103,19 +408,159 @@ class ConversationDB:
             total_tokens = input_tokens + output_tokens
             
         self.cursor.execute(
-            """
-            INSERT INTO token_usage (
-                conversation_id, input_tokens, output_tokens, total_tokens,
-                reasoning_tokens, accepted_prediction_tokens, rejected_prediction_tokens,
-                execution_time
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
+            _INSERT_USAGE_SQL,
             (conversation_id, input_tokens, output_tokens, total_tokens,
              reasoning_tokens, accepted_prediction_tokens, rejected_prediction_tokens,
              execution_time)
         )
         
-        self.conn.commit()
+        self._commit()
+    
+    def save_conversations_many(self, rows):
+        """
+        Insert many conversations with a single executemany in one transaction.
+        
+        Rows are consumed lazily, so a generator can stream a large import
+        without materializing it. Unlike save_conversation, no IDs are
+        returned (lastrowid is only meaningful for single inserts); use
+        self.conn.total_changes to track progress.
+        
+        Args:
+            rows (iterable): (model_name, prompt, response, metadata) tuples,
+                where metadata is a dict or None
+        
+        Returns:
+            int: Number of inserted conversations
+        """
+        if self.explicit_timestamp:
+            now = datetime.now().isoformat
+            sql = _INSERT_CONV_TS_SQL
+            params = (
+                (model_name, prompt, response, _dumps(metadata) if metadata else None, now())
+                for model_name, prompt, response, metadata in rows
+            )
+        else:
+            sql = _INSERT_CONV_SQL
+            params = (
+                (model_name, prompt, response, _dumps(metadata) if metadata else None)
+                for model_name, prompt, response, metadata in rows
+            )
+        
+        with self.bulk():
+            self.cursor.executemany(sql, params)
+        return self.cursor.rowcount
+    
+    def save_token_usage_many(self, rows):
+        """
+        Insert many token usage rows with a single executemany.
+        
+        Call inside `with db.bulk():` together with save_conversations_many
+        to write both tables in the same transaction.
+        
+        Args:
+            rows (iterable): (conversation_id, input_tokens, output_tokens,
+                total_tokens, reasoning_tokens, accepted_prediction_tokens,
+                rejected_prediction_tokens, execution_time) tuples; a None
+                total_tokens is computed from input + output
+        
+        Returns:
+            int: Number of inserted rows
+        """
+        params = (
+            (row[0], row[1], row[2], row[1] + row[2] if row[3] is None else row[3], *row[4:])
+            for row in rows
+        )
+        
+        with self.bulk():
+            self.cursor.executemany(_INSERT_USAGE_SQL, params)
+        return self.cursor.rowcount
+    
+    def save_conversation_with_usage(self, model_name, prompt, response, metadata=None, **usage):
+        """
+        Save a conversation and its token usage in a single transaction.
+        
+        Args:
+            model_name (str): The name of the model used
+            prompt (str): The user's prompt
+            response (str): The model's response
+            metadata (dict): Additional metadata about the conversation
+            **usage: Keyword arguments forwarded to save_token_usage; the usage
+                row is skipped when none are given
+        
+        Returns:
+            int: The ID of the inserted conversation
+        """
+        with self.bulk():
+            conversation_id = self.save_conversation(model_name, prompt, response, metadata)
+            if usage:
+                self.save_token_usage(conversation_id, **usage)
+        return conversation_id
+    
+    @contextmanager
+    def bulk(self):
+        """
+        Defer commits until the end of the block so that several writes share
+        one transaction (and one fsync). Rolls back if the block raises.
+        
+        Usage:
+            with db.bulk():
+                for ...:
+                    db.save_conversation(...)
+        """
+        if self._in_bulk:
+            # Already inside an outer bulk block; it owns the commit
+            yield self
+            return
+        
+        conn = self.conn
+        self._in_bulk = True
+        try:
+            # Take the write lock up front so a concurrent writer can't force
+            # a deadlocked read-to-write upgrade halfway through the block
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            with conn:
+                yield self
+        finally:
+            self._in_bulk = False
+    
+    def _commit(self):
+        """Commit the current transaction unless a bulk() block is active."""
+        if not self._in_bulk:
+            self.conn.commit()
+    
+    def get_cached_response(self, cache_key):
+        """
+        Look up a cached response.
+        
+        Args:
+            cache_key (str): Hash of the request parameters
+            
+        Returns:
+            dict: The cached response data or None if not found
+        """
+        self.cursor.execute(
+            "SELECT response, output_tokens, total_tokens FROM response_cache WHERE cache_key = ?",
+            (cache_key,)
+        )
+        row = self.cursor.fetchone()
+        return dict(row) if row else None
+    
+    def put_cached_response(self, cache_key, response, output_tokens=None, total_tokens=None):
+        """
+        Store (or replace) a cached response.
+        
+        Args:
+            cache_key (str): Hash of the request parameters
+            response (str): The model's response
+            output_tokens (int): Number of output tokens
+            total_tokens (int): Total number of tokens
+        """
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO response_cache (cache_key, response, output_tokens, total_tokens) VALUES (?, ?, ?, ?)",
+            (cache_key, response, output_tokens, total_tokens)
+        )
+        self._commit()
     
     def get_conversation(self, conversation_id):
         """
@@ -127,31 +572,11 @@ class ConversationDB:
         Returns:
             dict: The conversation data or None if not found
         """
-        self.cursor.execute(
-            """
-            SELECT c.*, t.input_tokens, t.output_tokens, t.total_tokens
-            FROM conversations c
-            LEFT JOIN token_usage t ON c.id = t.conversation_id
-            WHERE c.id = ?
-            """, 
-            (conversation_id,)
-        )
+        self.cursor.execute(_GET_CONV_SQL, (conversation_id,))
         
         row = self.cursor.fetchone()
         if row:
-            result = dict(row)
-            if result['metadata']:
-                result['metadata'] = json.loads(result['metadata'])
-                
-            # Add reasoning tokens info if available
-            if 'reasoning_tokens' in result and result['reasoning_tokens'] is not None:
-                result['reasoning_tokens_info'] = {
-                    'reasoning_tokens': result['reasoning_tokens'],
-                    'accepted_prediction_tokens': result['accepted_prediction_tokens'],
-                    'rejected_prediction_tokens': result['rejected_prediction_tokens']
-                }
-                
-            return result
+            return _row_to_dict(row)
         return None
     
     def get_all_conversations(self, limit=100, offset=0):
@@ -159,43 +584,31 @@ class ConversationDB:
         Retrieve all conversations with pagination.
         
         Args:
-            limit (int): Maximum number of conversations to retrieve
+            limit (int): Maximum number of conversations to retrieve (None for all)
             offset (int): Number of conversations to skip
             
         Returns:
             list: List of conversation dictionaries
         """
-        self.cursor.execute(
-            """
-            SELECT c.*, t.input_tokens, t.output_tokens, t.total_tokens, 
-                   t.reasoning_tokens, t.accepted_prediction_tokens, t.rejected_prediction_tokens,
-                   t.execution_time
-            FROM conversations c
-            LEFT JOIN token_usage t ON c.id = t.conversation_id
-            ORDER BY c.timestamp DESC
-            LIMIT ? OFFSET ?
-            """, 
-            (limit, offset)
-        )
+        return list(self.iter_conversations(limit=limit, offset=offset))
+    
+    def iter_conversations(self, limit=100, offset=0):
+        """
+        Lazily yield conversations with pagination, newest first.
+        
+        Rows are streamed from a dedicated cursor, so memory stays constant
+        regardless of `limit`.
         
-        rows = self.cursor.fetchall()
-        result = []
-        for row in rows:
-            conversation = dict(row)
-            if conversation['metadata']:
-                conversation['metadata'] = json.loads(conversation['metadata'])
-                
-            # Add reasoning tokens info if available
-            if 'reasoning_tokens' in conversation and conversation['reasoning_tokens'] is not None:
-                conversation['reasoning_tokens_info'] = {
-                    'reasoning_tokens': conversation['reasoning_tokens'],
-                    'accepted_prediction_tokens': conversation['accepted_prediction_tokens'],
-                    'rejected_prediction_tokens': conversation['rejected_prediction_tokens']
-                }
-                
-            result.append(conversation)
-        
-        return result
+        Args:
+            limit (int): Maximum number of conversations to retrieve (None for all)
+            offset (int): Number of conversations to skip
+            
+        Yields:
+            dict: Conversation dictionaries
+        """
+        if limit is None:
+            limit = -1  # SQLite treats a negative LIMIT as unbounded
+        return self._iter_rows(_LIST_CONV_SQL, (limit, offset))
     
     def search_conversations(self, query, limit=100, offset=0):
         """
@@ -209,39 +622,72 @@ class ConversationDB:
         Returns:
             list: List of matching conversation dictionaries
         """
+        return list(self.iter_search_conversations(query, limit=limit, offset=offset))
+    
+    def iter_search_conversations(self, query, limit=100, offset=0):
+        """
+        Lazily yield conversations whose prompt or response contains `query`.
+        
+        Args:
+            query (str): Search query
+            limit (int): Maximum number of conversations to retrieve
+            offset (int): Number of conversations to skip
+            
+        Yields:
+            dict: Matching conversation dictionaries
+        """
+        # Trigram MATCH needs at least 3 characters; shorter queries use LIKE
+        if self.has_fts and len(query) >= 3:
+            phrase = _fts_phrase(query)
+            return self._iter_rows(_SEARCH_FTS_SQL, (phrase, limit, offset))
+        
         search_param = f"%{query}%"
-        self.cursor.execute(
-            """
-            SELECT c.*, t.input_tokens, t.output_tokens, t.total_tokens,
-                   t.reasoning_tokens, t.accepted_prediction_tokens, t.rejected_prediction_tokens,
-                   t.execution_time
-            FROM conversations c
-            LEFT JOIN token_usage t ON c.id = t.conversation_id
-            WHERE c.prompt LIKE ? OR c.response LIKE ?
-            ORDER BY c.timestamp DESC
-            LIMIT ? OFFSET ?
-            """, 
-            (search_param, search_param, limit, offset)
-        )
+        return self._iter_rows(_SEARCH_LIKE_SQL, (search_param, search_param, limit, offset))
+    
+    def search_conversations_for_model(self, query, model_name):
+        """
+        Find the newest conversation containing `query` whose model name is a
+        substring of `model_name` (e.g. "gpt-4o" for "gpt-4o-slow").
+        
+        The model filter runs in SQL, so only the matching row is fetched.
         
-        rows = self.cursor.fetchall()
-        result = []
-        for row in rows:
-            conversation = dict(row)
-            if conversation['metadata']:
-                conversation['metadata'] = json.loads(conversation['metadata'])
-                
-            # Add reasoning tokens info if available
-            if 'reasoning_tokens' in conversation and conversation['reasoning_tokens'] is not None:
-                conversation['reasoning_tokens_info'] = {
-                    'reasoning_tokens': conversation['reasoning_tokens'],
-                    'accepted_prediction_tokens': conversation['accepted_prediction_tokens'],
-                    'rejected_prediction_tokens': conversation['rejected_prediction_tokens']
-                }
-                
-            result.append(conversation)
-        
-        return result
+        Args:
+            query (str): Search query
+            model_name (str): Requested model name
+            
+        Returns:
+            dict: The conversation data or None if not found
+        """
+        if self.has_fts and len(query) >= 3:
+            phrase = _fts_phrase(query)
+            sql = _FOR_MODEL_FTS_SQL
+            params = (phrase, model_name)
+        else:
+            search_param = f"%{query}%"
+            sql = _FOR_MODEL_LIKE_SQL
+            params = (search_param, search_param, model_name)
+        
+        self.cursor.execute(sql, params)
+        row = self.cursor.fetchone()
+        if row:
+            return _row_to_dict(row)
+        return None
+    
+    def _iter_rows(self, sql, params):
+        """
+        Execute a query on its own cursor and yield rows as dicts.
+        
+        A separate cursor keeps a half-consumed iterator from being reset by
+        other queries issued through self.cursor in the meantime.
+        """
+        cursor = self.conn.cursor()
+        cursor.arraysize = 100
+        cursor.execute(sql, params)
+        try:
+            for row in cursor:
+                yield _row_to_dict(row)
+        finally:
+            cursor.close()
     
     def get_stats(self):
         """
@@ -285,8 +731,14 @@ class ConversationDB:
         return stats
     
     def close(self):
-        """Close the database connection."""
-        if self.conn:
-            self.conn.close()
-            self.conn = None
-            self.cursor = None
+        """
+        Close the database connections of all threads.
+        
+        Any thread that uses the instance afterwards transparently opens a
+        new connection.
+        """
+        with self._connections_lock:
+            holders = list(self._connections)
+            self._connections.clear()
+        for holder in holders:
+            holder.close()
@@ -1,12 +1,241 @@
+import asyncio
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import hashlib
 import json
-import sseclient
+import logging
+import re
+import sys
+import threading
 import time
 from database import ConversationDB
-import threading
 
-# Global database lock to ensure thread safety for database operations
-db_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+# orjson parses UTF-8 bytes directly and serializes request bodies straight to
+# UTF-8 bytes (no \uXXXX escaping of CJK prompts); fall back to stdlib json
+try:
+    import orjson as _json
+except ImportError:
+    _json = json
+
+
+# Whitespace bytes.lstrip() would remove after a "data:" field name
+_SSE_WHITESPACE = frozenset(b" \t\r\x0b\x0c")
+
+
+class _SSEParser:
+    """
+    Incremental Server-Sent Events parser producing (event_name, data) pairs.
+    
+    Splits lines in a bytearray, which is much cheaper than
+    response.iter_lines() or sseclient's byte-at-a-time reads. `data` is
+    kept as raw bytes (never decoded here; orjson parses it directly);
+    `event_name` defaults to "message".
+    """
+    
+    def __init__(self):
+        self.event = "message"
+        self.data_lines = []
+        self.buf = bytearray()
+    
+    def feed(self, chunk):
+        """Consume a chunk of the body and return the events it completed"""
+        events = []
+        buf = self.buf
+        buf += chunk
+        # Walk the buffer with offsets and drop consumed bytes once per chunk.
+        # Lines are never sliced out: fields are matched in place and only a
+        # data payload is copied, once (b"\n".join turns it into bytes)
+        start = 0
+        while (i := buf.find(b"\n", start)) != -1:
+            end = i
+            while end > start and buf[end - 1] == 0x0D:  # rstrip(b"\r")
+                end -= 1
+            
+            if end == start:
+                # Blank line ends the event
+                if self.data_lines:
+                    events.append((self.event, b"\n".join(self.data_lines)))
+                self.event = "message"
+                self.data_lines = []
+            elif buf.startswith(b"data:", start, end):
+                pos = start + 5
+                while pos < end and buf[pos] in _SSE_WHITESPACE:  # lstrip()
+                    pos += 1
+                self.data_lines.append(buf[pos:end])
+            elif buf.startswith(b"event:", start, end):
+                self.event = buf[start + 6:end].strip().decode("utf-8")
+            start = i + 1
+        del buf[:start]
+        return events
+    
+    def close(self):
+        """Return an event left unterminated at the end of the body"""
+        line = self.buf.rstrip(b"\r")
+        if line.startswith(b"data:"):
+            self.data_lines.append(line[5:].lstrip())
+        if self.data_lines:
+            return [(self.event, b"\n".join(self.data_lines))]
+        return []
+
+
+def _iter_sse(response, chunk_size=8192):
+    """Yield (event_name, data) pairs from a streaming requests response"""
+    parser = _SSEParser()
+    for chunk in response.iter_content(chunk_size=chunk_size, decode_unicode=False):
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+async def _aiter_sse(response):
+    """Yield (event_name, data) pairs from a streaming httpx response"""
+    parser = _SSEParser()
+    # No chunk size: httpx would otherwise hold data back until a full chunk
+    # has arrived; take bytes as they come and let the parser frame them
+    async for chunk in response.aiter_bytes():
+        for event in parser.feed(chunk):
+            yield event
+    for event in parser.close():
+        yield event
+
+
+# Shared by all printers so concurrent streams never interleave mid-write
+_stdout_lock = threading.Lock()
+
+
+class _TokenPrinter:
+    """Buffer streamed tokens and write them to stdout in batches"""
+    
+    def __init__(self, interval=0.05, max_pending=64):
+        self.buf = []
+        self.interval = interval
+        self.max_pending = max_pending
+        self.last_flush = time.monotonic()
+    
+    def write(self, text):
+        """Queue text; flush once enough tokens or time have accumulated"""
+        self.buf.append(text)
+        if len(self.buf) >= self.max_pending or time.monotonic() - self.last_flush > self.interval:
+            self.flush()
+    
+    def flush(self):
+        """Write all queued text with a single write() call"""
+        if self.buf:
+            text = "".join(self.buf)
+            self.buf.clear()
+            with _stdout_lock:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+        self.last_flush = time.monotonic()
+
+
+class _OpenAIStream:
+    """Accumulate an OpenAI-compatible chat completion stream event by event"""
+    
+    def __init__(self):
+        self.parts = []             # 用于累积完整响应内容
+        self.total_tokens = 0       # 总令牌数
+        self.completion_tokens = 0  # 完成令牌数
+        self.completed = False      # 是否收到[DONE]
+        self.printer = _TokenPrinter()
+    
+    def feed(self, event_name, payload):
+        """
+        Handle one SSE event.
+        
+        Returns:
+            bool: False once the stream is finished
+        """
+        if payload == b"[DONE]":
+            self.completed = True
+            return False
+        try:
+            json_data = _json.loads(payload)
+        except _json.JSONDecodeError:
+            return False
+        
+        # 检查令牌使用信息（通常在流的最后一块）
+        if "usage" in json_data and json_data["usage"] is not None:
+            self.completion_tokens = json_data["usage"].get("completion_tokens", 0)
+            self.total_tokens = json_data["usage"].get("total_tokens", 0)
+        
+        # 检查并处理内容
+        if "choices" in json_data and json_data["choices"]:
+            content = json_data["choices"][0]["delta"].get("content", "")
+            if content:  # 当内容非空时打印并累积
+                self.printer.write(content)
+                self.parts.append(content)
+        return True
+    
+    def finish(self):
+        """Flush pending output and return the full response text"""
+        self.printer.flush()
+        return "".join(self.parts)
+
+
+class _ClaudeStream:
+    """Accumulate a Claude messages stream event by event"""
+    
+    def __init__(self):
+        # Text chunks, joined once the stream ends
+        self.parts = []
+        self.input_tokens = 0
+        self.output_tokens = 0
+        # Set by message_stop; an error or a dropped connection leaves it False
+        self.completed = False
+        self.printer = _TokenPrinter()
+    
+    def feed(self, event_name, event_data):
+        """
+        Handle one SSE event.
+        
+        Returns:
+            bool: False if the stream reported an error
+        """
+        if event_name == "ping":
+            return True  # Ignore ping events
+        
+        if event_name == "error":
+            print(f"Error: {event_data.decode('utf-8', errors='replace')}")
+            return False
+        
+        try:
+            data = _json.loads(event_data)
+            event_type = data.get("type")
+            
+            # Handle text increments
+            if event_type == "content_block_delta":
+                delta = data.get("delta", {})
+                if delta.get("type") == "text_delta":
+                    text_chunk = delta.get("text", "")
+                    self.parts.append(text_chunk)
+                    self.printer.write(text_chunk)  # Batched output of text increments
+            
+            # Handle message end
+            elif event_type == "message_stop":
+                self.completed = True
+                self.printer.flush()
+                print("\n\n--- Response completed ---")
+            
+            # Extract token usage if available
+            if "usage" in data:
+                self.input_tokens = data["usage"].get("input_tokens", 0)
+                self.output_tokens = data["usage"].get("output_tokens", 0)
+        
+        except _json.JSONDecodeError:
+            print(f"Failed to parse JSON: {event_data.decode('utf-8', errors='replace')}")
+        except Exception as e:
+            print(f"Error processing event: {e}")
+        return True
+    
+    def finish(self):
+        """Flush pending output and return the full response text"""
+        self.printer.flush()
+        return "".join(self.parts)
+
+
 class LLMClient:
     def __init__(self, api_base_url, api_key_str, proxies_set, db_path="conversations.db"):
         # API configurations
@@ -14,49 +243,148 @@ class LLMClient:
         self.api_key = api_key_str
         self.proxies = proxies_set
         
+        # Keep-alive connection pool reused across requests to the same host
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        # Retry inside the pool, reusing the TCP connection, only where the
+        # completion cannot have run: connection failures and 429/503
+        # rejections. Read errors and other 5xx are not retried, since the
+        # POST may already have been processed (and billed).
+        retry = Retry(
+            total=3,
+            connect=3,
+            read=0,
+            other=0,
+            backoff_factor=0.5,
+            status_forcelist=(429, 503),
+            allowed_methods=None,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
         # Default model settings
-        self.openai_compatible_models = ["o1", "deepseek-chat", "gpt-4o", "o3-mini", "deepseek-ai/DeepSeek-R1", "TA/deepseek-ai/DeepSeek-R1"]
-        self.claude_models = ["claude-3-5-sonnet", "claude-3-7-sonnet-20250219", "claude"]
+        self.openai_compatible_models = ("o1", "deepseek-chat", "gpt-4o", "o3-mini", "deepseek-ai/DeepSeek-R1", "TA/deepseek-ai/DeepSeek-R1")
+        self.claude_models = ("claude-3-5-sonnet", "claude-3-7-sonnet-20250219", "claude")
+        # One alternation instead of a substring scan per Claude model
+        self._claude_re = re.compile("|".join(map(re.escape, self.claude_models)))
+        # Model name -> is_claude_model() result, filled on first use
+        self._is_claude_cache = {}
         
         # Anthropic API settings
         # self.anthropic_version = "2023-06-01"
         
-        # Initialize database connection with thread safety
+        # Request headers are fixed per client; build them once
+        self._claude_headers = {
+            "x-API-key": api_key_str,
+            # "anthropic-version": self.anthropic_version,
+            "content-type": "application/json"
+        }
+        self._openai_headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key_str}",
+        }
+        # identity: a gzip-encoded stream would be buffered before the first token
+        self._openai_stream_headers = {**self._openai_headers, "Accept-Encoding": "identity"}
+        
+        # ConversationDB opens one connection per thread; WAL + busy_timeout
+        # let concurrent workers write without a Python-level lock
         self.db = ConversationDB(db_path)
-        self.db_lock = db_lock  # Use the global lock for database operations
     
     def is_claude_model(self, model_name):
         """Check if the model is a Claude model"""
-        return any(claude_model in model_name for claude_model in self.claude_models)
+        result = self._is_claude_cache.get(model_name)
+        if result is None:
+            result = self._is_claude_cache[model_name] = self._claude_re.search(model_name) is not None
+        return result
     
     def get_headers(self, model_name):
         """Get appropriate headers based on model type"""
+        return self._claude_headers if self.is_claude_model(model_name) else self._openai_headers
+    
+    @staticmethod
+    def _cache_key(prompt, model_name, stream, max_tokens, thinking, reasoning_effort):
+        """Build the response-cache key from everything that shapes the answer"""
+        payload = json.dumps(
+            {
+                "prompt": prompt,
+                "model": model_name,
+                "stream": stream,
+                "max_tokens": max_tokens,
+                "thinking": thinking,
+                "reasoning_effort": reasoning_effort,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _lookup_cache(self, prompt, model_name, stream, max_tokens, thinking, reasoning_effort, use_cache):
+        """
+        Resolve the response-cache key and print a cached answer if present.
+        
+        Returns:
+            tuple: (cache_key, hit); cache_key is None when caching is off
+        """
+        if not use_cache or reasoning_effort == "high":
+            return None, False
+        
+        cache_key = self._cache_key(prompt, model_name, stream, max_tokens, thinking, reasoning_effort)
+        cached = self.db.get_cached_response(cache_key)
+        if cached is not None:
+            print("(cached response)")
+            print(cached["response"])
+            return cache_key, True
+        return cache_key, False
+    
+    def make_request(self, prompt, model_name="o1", stream=True, max_tokens=20000, thinking=None, reasoning_effort=None, use_cache=False):
+        """
+        Make a request to the LLM API
+        
+        With use_cache=True, an identical earlier request (same prompt, model
+        and parameters) is answered from the database without calling the API.
+        High reasoning effort runs are never cached.
+        """
+        # Long prompts would flood stdout under concurrent workers; log a prefix
+        logger.debug("Prompt: %s", prompt[:200])
+        print(f"Model: {model_name}")
+        
+        cache_key, hit = self._lookup_cache(prompt, model_name, stream, max_tokens, thinking, reasoning_effort, use_cache)
+        if hit:
+            return
+        
         if self.is_claude_model(model_name):
-            return {
-                "x-API-key": self.api_key,
-                # "anthropic-version": self.anthropic_version,
-                "content-type": "application/json"
-            }
+            return self._make_claude_request(prompt, model_name, stream, max_tokens, thinking, cache_key=cache_key)
         else:
-            return {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}",
-            }
+            return self._make_openai_request(prompt, model_name, stream, reasoning_effort, cache_key=cache_key)
     
-    def make_request(self, prompt, model_name="o1", stream=True, max_tokens=20000, thinking=None, reasoning_effort=None):
-        """Make a request to the LLM API"""
-        print(f"Prompt: {prompt}")
+    async def amake_request(self, client, prompt, model_name="o1", stream=True, max_tokens=20000, thinking=None, reasoning_effort=None, use_cache=False):
+        """
+        Async variant of make_request sending through an httpx.AsyncClient.
+        
+        Many of these can run concurrently on one event loop (and, with
+        HTTP/2, over one connection per host). Proxies are configured on the
+        httpx client rather than per request. Cache lookups and database
+        writes run in worker threads (each with its own connection), so a
+        write waiting on the SQLite lock never stalls the other streams.
+        """
+        # Long prompts would flood stdout under concurrent workers; log a prefix
+        logger.debug("Prompt: %s", prompt[:200])
         print(f"Model: {model_name}")
         
+        cache_key, hit = await asyncio.to_thread(self._lookup_cache, prompt, model_name, stream, max_tokens, thinking, reasoning_effort, use_cache)
+        if hit:
+            return
+        
         if self.is_claude_model(model_name):
-            return self._make_claude_request(prompt, model_name, stream, max_tokens, thinking)
+            return await self._amake_claude_request(client, prompt, model_name, stream, max_tokens, thinking, cache_key=cache_key)
         else:
-            return self._make_openai_request(prompt, model_name, stream, reasoning_effort)
+            return await self._amake_openai_request(client, prompt, model_name, stream, reasoning_effort, cache_key=cache_key)
     
-    def _make_openai_request(self, prompt, model_name, stream=True, reasoning_effort=None):
-        """Make a request to OpenAI-compatible API"""
-        # Record start time
-        start_time = time.time()
+    def _openai_request_data(self, prompt, model_name, stream, reasoning_effort):
+        """Build the OpenAI-compatible request body"""
         data = {
             "model": model_name,
             "messages": [
@@ -73,161 +401,193 @@ class LLMClient:
             data["reasoning_effort"] = reasoning_effort
             print(f"Reasoning effort: {reasoning_effort}")
         
+        if not stream:
+            del data["stream"]
+        return data
+    
+    def _make_openai_request(self, prompt, model_name, stream=True, reasoning_effort=None, cache_key=None):
+        """Make a request to OpenAI-compatible API"""
+        # Record start time
+        start_time = time.time()
+        data = self._openai_request_data(prompt, model_name, stream, reasoning_effort)
+        
         if stream:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.api_base}/chat/completions",
-                headers=self.get_headers(model_name),
-                data=json.dumps(data),
+                headers=self._openai_stream_headers,
+                data=_json.dumps(data),
                 proxies=self.proxies,
                 stream=True,
             )
-
-            # 初始化变量
-            accumulated_text = ""  # 用于累积完整响应内容
-            total_tokens = 0       # 总令牌数
-            completion_tokens = 0  # 完成令牌数
-
-            # 逐行处理流式响应
-            for line in response.iter_lines():
-                if line:
-                    decoded_line = line.decode('utf-8')
-                    if decoded_line.startswith("data:"):
-                        try:
-                            json_data = json.loads(decoded_line[5:])  # 移除 "data: " 前缀
-                        except json.decoder.JSONDecodeError:
-                            break
-                        
-                        # 检查令牌使用信息（通常在流的最后一块）
-                        if "usage" in json_data and json_data["usage"] is not None:
-                            completion_tokens = json_data["usage"].get("completion_tokens", 0)
-                            total_tokens = json_data["usage"].get("total_tokens", 0)
-                        
-                        # 检查并处理内容
-                        if "choices" in json_data and json_data["choices"]:
-                            content = json_data["choices"][0]["delta"].get("content", "")
-                            if content:  # 当内容非空时打印并累积
-                                print(content, end="", flush=True)
-                                accumulated_text += content
-                        
-            # Print token statistics if available
-            if completion_tokens > 0:
-                print("\n\n--- Token Statistics ---")
-                print(f"Completion tokens: {completion_tokens}")
-                print(f"Total tokens: {total_tokens}")
-                
-            # Save conversation to database with thread safety
-            metadata = {
-                "stream": stream,
-                "reasoning_effort": reasoning_effort
-            }
+            if response.status_code != 200:
+                print(model_name)
+                print(response.text)
+            response.raise_for_status()
             
-            # Use thread lock for database operations
-            with self.db_lock:
-                conversation_id = self.db.save_conversation(
-                    model_name=model_name,
-                    prompt=prompt,
-                    response=accumulated_text,
-                    metadata=metadata
-                )
-                
-                # Calculate execution time
-                execution_time = time.time() - start_time
-                print(f"Execution time: {execution_time:.2f} seconds")
-                
-                # Save token usage if available
-                if completion_tokens > 0:
-                    self.db.save_token_usage(
-                        conversation_id=conversation_id,
-                        input_tokens=total_tokens - completion_tokens,
-                        output_tokens=completion_tokens,
-                        total_tokens=total_tokens,
-                        execution_time=execution_time
-                    )
+            state = _OpenAIStream()
+            for event_name, payload in _iter_sse(response):
+                if not state.feed(event_name, payload):
+                    break
+            
+            self._save_openai_stream(state, prompt, model_name, stream, reasoning_effort, start_time, cache_key)
         else:
-            del data["stream"]
-            response = requests.post(
+            response = self.session.post(
                 f"{self.api_base}/chat/completions",
                 headers=self.get_headers(model_name),
-                data=json.dumps(data),
+                data=_json.dumps(data),
                 proxies=self.proxies,
             )
             if response.status_code != 200:
                 print(model_name)
                 print(response.text)
             response.raise_for_status()
-            response_json = response.json()
-            completion = response_json["choices"][0]["message"]["content"]
-            print(completion)
             
-            # Print token statistics
-            input_tokens = 0
-            output_tokens = 0
-            total_tokens = 0
-            reasoning_tokens = None
-            accepted_prediction_tokens = None
-            rejected_prediction_tokens = None
-            
-            if "usage" in response_json:
-                usage = response_json["usage"]
-                print("\n--- Token Statistics ---")
-                input_tokens = usage.get('prompt_tokens', 0)
-                output_tokens = usage.get('completion_tokens', 0)
-                total_tokens = usage.get('total_tokens', 0)
-                print(f"Prompt tokens: {input_tokens}")
-                print(f"Completion tokens: {output_tokens}")
-                print(f"Total tokens: {total_tokens}")
+            self._save_openai_response(response.json(), prompt, model_name, stream, reasoning_effort, start_time, cache_key)
+    
+    async def _amake_openai_request(self, client, prompt, model_name, stream=True, reasoning_effort=None, cache_key=None):
+        """Async counterpart of _make_openai_request"""
+        start_time = time.time()
+        data = self._openai_request_data(prompt, model_name, stream, reasoning_effort)
+        url = f"{self.api_base}/chat/completions"
+        
+        if stream:
+            async with client.stream("POST", url, headers=self._openai_stream_headers, content=_json.dumps(data)) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    print(model_name)
+                    print(response.text)
+                response.raise_for_status()
                 
-                # Print detailed completion token stats if available
-                if "completion_tokens_details" in usage:
-                    details = usage["completion_tokens_details"]
-                    reasoning_tokens = details.get('reasoning_tokens')
-                    accepted_prediction_tokens = details.get('accepted_prediction_tokens')
-                    rejected_prediction_tokens = details.get('rejected_prediction_tokens')
-                    
-                    print("Completion tokens details:")
-                    print(f"  Reasoning tokens: {reasoning_tokens if reasoning_tokens is not None else 'N/A'}")
-                    print(f"  Accepted prediction tokens: {accepted_prediction_tokens if accepted_prediction_tokens is not None else 'N/A'}")
-                    print(f"  Rejected prediction tokens: {rejected_prediction_tokens if rejected_prediction_tokens is not None else 'N/A'}")
+                state = _OpenAIStream()
+                async for event_name, payload in _aiter_sse(response):
+                    if not state.feed(event_name, payload):
+                        break
             
-            # Calculate execution time
-            execution_time = time.time() - start_time
-            print(f"Execution time: {execution_time:.2f} seconds")
+            await asyncio.to_thread(self._save_openai_stream, state, prompt, model_name, stream, reasoning_effort, start_time, cache_key)
+        else:
+            response = await client.post(url, headers=self.get_headers(model_name), content=_json.dumps(data))
+            if response.status_code != 200:
+                print(model_name)
+                print(response.text)
+            response.raise_for_status()
             
-            # Save conversation to database with thread safety
-            metadata = {
-                "stream": stream,
-                "reasoning_effort": reasoning_effort
+            await asyncio.to_thread(self._save_openai_response, _json.loads(response.content), prompt, model_name, stream, reasoning_effort, start_time, cache_key)
+    
+    def _save_openai_stream(self, state, prompt, model_name, stream, reasoning_effort, start_time, cache_key):
+        """Print statistics for a finished OpenAI stream and store it"""
+        accumulated_text = state.finish()
+        completion_tokens = state.completion_tokens
+        total_tokens = state.total_tokens
+        
+        # Print token statistics if available
+        if completion_tokens > 0:
+            print("\n\n--- Token Statistics ---")
+            print(f"Completion tokens: {completion_tokens}")
+            print(f"Total tokens: {total_tokens}")
+            
+        # Save conversation to database
+        metadata = {
+            "stream": stream,
+            "reasoning_effort": reasoning_effort
+        }
+        
+        # Calculate execution time
+        execution_time = time.time() - start_time
+        print(f"Execution time: {execution_time:.2f} seconds")
+        
+        # Save the conversation and its token usage in one transaction
+        usage = {}
+        if completion_tokens > 0:
+            usage = {
+                "input_tokens": total_tokens - completion_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": total_tokens,
+                "execution_time": execution_time
             }
+        self.db.save_conversation_with_usage(
+            model_name=model_name,
+            prompt=prompt,
+            response=accumulated_text,
+            metadata=metadata,
+            **usage
+        )
+        
+        # Remember the answer for identical future requests; a stream that
+        # failed or was cut off must not be replayed from the cache
+        if cache_key is not None and state.completed and accumulated_text:
+            self.db.put_cached_response(cache_key, accumulated_text, completion_tokens, total_tokens)
+    
+    def _save_openai_response(self, response_json, prompt, model_name, stream, reasoning_effort, start_time, cache_key):
+        """Print and store a non-streaming OpenAI response"""
+        completion = response_json["choices"][0]["message"]["content"]
+        print(completion)
+        
+        # Print token statistics
+        input_tokens = 0
+        output_tokens = 0
+        total_tokens = 0
+        reasoning_tokens = None
+        accepted_prediction_tokens = None
+        rejected_prediction_tokens = None
+        
+        if "usage" in response_json:
+            usage = response_json["usage"]
+            print("\n--- Token Statistics ---")
+            input_tokens = usage.get('prompt_tokens', 0)
+            output_tokens = usage.get('completion_tokens', 0)
+            total_tokens = usage.get('total_tokens', 0)
+            print(f"Prompt tokens: {input_tokens}")
+            print(f"Completion tokens: {output_tokens}")
+            print(f"Total tokens: {total_tokens}")
             
-            # Use thread lock for database operations
-            with self.db_lock:
-                conversation_id = self.db.save_conversation(
-                    model_name=model_name,
-                    prompt=prompt,
-                    response=completion,
-                    metadata=metadata
-                )
+            # Print detailed completion token stats if available
+            if "completion_tokens_details" in usage:
+                details = usage["completion_tokens_details"]
+                reasoning_tokens = details.get('reasoning_tokens')
+                accepted_prediction_tokens = details.get('accepted_prediction_tokens')
+                rejected_prediction_tokens = details.get('rejected_prediction_tokens')
                 
-                # Save token usage if available
-                if total_tokens > 0:
-                    self.db.save_token_usage(
-                        conversation_id=conversation_id,
-                        input_tokens=input_tokens,
-                        output_tokens=output_tokens,
-                        total_tokens=total_tokens,
-                        reasoning_tokens=reasoning_tokens,
-                        accepted_prediction_tokens=accepted_prediction_tokens,
-                        rejected_prediction_tokens=rejected_prediction_tokens,
-                        execution_time=execution_time
-                    )
-    
-    def _make_claude_request(self, prompt, model_name, stream=True, max_tokens=20000, thinking=None, reasoning_effort=None):
-        """Make a request to Claude API"""
-        # Record start time
-        start_time = time.time()
-        url = f"{self.api_base}/messages"
-        headers = self.get_headers(model_name)
+                print("Completion tokens details:")
+                print(f"  Reasoning tokens: {reasoning_tokens if reasoning_tokens is not None else 'N/A'}")
+                print(f"  Accepted prediction tokens: {accepted_prediction_tokens if accepted_prediction_tokens is not None else 'N/A'}")
+                print(f"  Rejected prediction tokens: {rejected_prediction_tokens if rejected_prediction_tokens is not None else 'N/A'}")
+        
+        # Calculate execution time
+        execution_time = time.time() - start_time
+        print(f"Execution time: {execution_time:.2f} seconds")
+        
+        # Save conversation to database
+        metadata = {
+            "stream": stream,
+            "reasoning_effort": reasoning_effort
+        }
+        
+        # Save the conversation and its token usage in one transaction
+        usage = {}
+        if total_tokens > 0:
+            usage = {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": total_tokens,
+                "reasoning_tokens": reasoning_tokens,
+                "accepted_prediction_tokens": accepted_prediction_tokens,
+                "rejected_prediction_tokens": rejected_prediction_tokens,
+                "execution_time": execution_time
+            }
+        self.db.save_conversation_with_usage(
+            model_name=model_name,
+            prompt=prompt,
+            response=completion,
+            metadata=metadata,
+            **usage
+        )
         
+        # Remember the answer for identical future requests
+        if cache_key is not None:
+            self.db.put_cached_response(cache_key, completion, output_tokens, total_tokens)
+    
+    def _claude_request_data(self, prompt, model_name, stream, max_tokens, thinking):
+        """Build the Claude request body"""
         messages = [
             {"role": "user", "content": prompt}
         ]
@@ -242,145 +602,159 @@ class LLMClient:
         # Add thinking if provided
         if thinking:
             data["thinking"] = thinking
+        return data
+    
+    def _make_claude_request(self, prompt, model_name, stream=True, max_tokens=20000, thinking=None, reasoning_effort=None, cache_key=None):
+        """Make a request to Claude API"""
+        # Record start time
+        start_time = time.time()
+        url = f"{self.api_base}/messages"
+        headers = self.get_headers(model_name)
+        data = self._claude_request_data(prompt, model_name, stream, max_tokens, thinking)
         
-        response = requests.post(url, headers=headers, json=data, proxies=self.proxies, stream=stream)
+        response = self.session.post(url, headers=headers, data=_json.dumps(data), proxies=self.proxies, stream=stream)
         
         if not (response.status_code == 200):
             print(f"Error: status_code:{response.status_code}, {response.text}")
             return -1
         
         if stream:
-            # Use sseclient to handle SSE stream
-            client = sseclient.SSEClient(response)
-            
-            # Variable to accumulate text
-            accumulated_text = ""
-            input_tokens = 0
-            output_tokens = 0
-            
-            # Process SSE events
-            for event in client.events():
-                if event.event == "ping":
-                    continue  # Ignore ping events
-                
-                if event.event == "error":
-                    print(f"Error: {event.data}")
+            state = _ClaudeStream()
+            for event_name, event_data in _iter_sse(response):
+                if not state.feed(event_name, event_data):
                     break
-                
-                try:
-                    data = json.loads(event.data)
-                    event_type = data.get("type")
-                    
-                    # Handle text increments
-                    if event_type == "content_block_delta":
-                        delta = data.get("delta", {})
-                        if delta.get("type") == "text_delta":
-                            text_chunk = delta.get("text", "")
-                            accumulated_text += text_chunk
-                            print(text_chunk, end="", flush=True)  # Output text increment immediately
-                    
-                    # Handle message end
-                    elif event_type == "message_stop":
-                        print("\n\n--- Response completed ---")
-                    
-                    # Extract token usage if available
-                    if "usage" in data:
-                        input_tokens = data["usage"].get("input_tokens", 0)
-                        output_tokens = data["usage"].get("output_tokens", 0)
-                
-                except json.JSONDecodeError:
-                    print(f"Failed to parse JSON: {event.data}")
-                except Exception as e:
-                    print(f"Error processing event: {e}")
-            
-            print("\n\nComplete response:")
-            print(accumulated_text)
             
-            # Print token statistics if available
-            if input_tokens > 0 or output_tokens > 0:
-                print("\n--- Token Statistics ---")
-                print(f"Input tokens: {input_tokens}")
-                print(f"Output tokens: {output_tokens}")
-                print(f"Total tokens: {input_tokens + output_tokens}")
+            self._save_claude_stream(state, prompt, model_name, stream, max_tokens, thinking, start_time, cache_key)
+        else:
+            self._save_claude_response(response.json(), prompt, model_name, stream, max_tokens, start_time, cache_key)
+    
+    async def _amake_claude_request(self, client, prompt, model_name, stream=True, max_tokens=20000, thinking=None, reasoning_effort=None, cache_key=None):
+        """Async counterpart of _make_claude_request"""
+        start_time = time.time()
+        url = f"{self.api_base}/messages"
+        headers = self.get_headers(model_name)
+        data = self._claude_request_data(prompt, model_name, stream, max_tokens, thinking)
+        
+        if stream:
+            async with client.stream("POST", url, headers=headers, content=_json.dumps(data)) as response:
+                if not (response.status_code == 200):
+                    await response.aread()
+                    print(f"Error: status_code:{response.status_code}, {response.text}")
+                    return -1
                 
-            # Save conversation to database with thread safety
-            metadata = {
-                "stream": stream,
-                "max_tokens": max_tokens,
-                "thinking": thinking
-            }
+                state = _ClaudeStream()
+                async for event_name, event_data in _aiter_sse(response):
+                    if not state.feed(event_name, event_data):
+                        break
             
-            # Use thread lock for database operations
-            with self.db_lock:
-                conversation_id = self.db.save_conversation(
-                    model_name=model_name,
-                    prompt=prompt,
-                    response=accumulated_text,
-                    metadata=metadata
-                )
-                
-                # Calculate execution time
-                execution_time = time.time() - start_time
-                print(f"Execution time: {execution_time:.2f} seconds")
-                
-                # Save token usage if available
-                if input_tokens > 0 or output_tokens > 0:
-                    self.db.save_token_usage(
-                        conversation_id=conversation_id,
-                        input_tokens=input_tokens,
-                        output_tokens=output_tokens,
-                        execution_time=execution_time
-                    )
+            await asyncio.to_thread(self._save_claude_stream, state, prompt, model_name, stream, max_tokens, thinking, start_time, cache_key)
         else:
-            # Non-streaming request
-            response_json = response.json()
-            content = response_json.get("content", [])
-            response_text = ""
-            for block in content:
-                if block.get("type") == "text":
-                    text = block.get("text", "")
-                    response_text += text
-                    print(text)
+            response = await client.post(url, headers=headers, content=_json.dumps(data))
+            if not (response.status_code == 200):
+                print(f"Error: status_code:{response.status_code}, {response.text}")
+                return -1
             
-            # Print token statistics if available
-            input_tokens = 0
-            output_tokens = 0
-            if "usage" in response_json:
-                usage = response_json["usage"]
-                print("\n--- Token Statistics ---")
-                input_tokens = usage.get('input_tokens', 0)
-                output_tokens = usage.get('output_tokens', 0)
-                print(f"Input tokens: {input_tokens}")
-                print(f"Output tokens: {output_tokens}")
-                if "input_tokens" in usage and "output_tokens" in usage:
-                    total = usage["input_tokens"] + usage["output_tokens"]
-                    print(f"Total tokens: {total}")
-                    
-            # Save conversation to database with thread safety
-            metadata = {
-                "stream": stream,
-                "max_tokens": max_tokens,
-                # "reasoning_effort": reasoning_effort  # Claude API不需要此参数
-            }
+            await asyncio.to_thread(self._save_claude_response, _json.loads(response.content), prompt, model_name, stream, max_tokens, start_time, cache_key)
+    
+    def _save_claude_stream(self, state, prompt, model_name, stream, max_tokens, thinking, start_time, cache_key):
+        """Print statistics for a finished Claude stream and store it"""
+        accumulated_text = state.finish()
+        input_tokens = state.input_tokens
+        output_tokens = state.output_tokens
+        
+        print("\n\nComplete response:")
+        print(accumulated_text)
+        
+        # Print token statistics if available
+        if input_tokens > 0 or output_tokens > 0:
+            print("\n--- Token Statistics ---")
+            print(f"Input tokens: {input_tokens}")
+            print(f"Output tokens: {output_tokens}")
+            print(f"Total tokens: {input_tokens + output_tokens}")
             
-            # Use thread lock for database operations
-            with self.db_lock:
-                conversation_id = self.db.save_conversation(
-                    model_name=model_name,
-                    prompt=prompt,
-                    response=response_text,
-                    metadata=metadata
-                )
-                
-                # Calculate execution time
-                execution_time = time.time() - start_time
-                print(f"Execution time: {execution_time:.2f} seconds")
+        # Save conversation to database
+        metadata = {
+            "stream": stream,
+            "max_tokens": max_tokens,
+            "thinking": thinking
+        }
+        
+        # Calculate execution time
+        execution_time = time.time() - start_time
+        print(f"Execution time: {execution_time:.2f} seconds")
+        
+        # Save the conversation and its token usage in one transaction
+        usage = {}
+        if input_tokens > 0 or output_tokens > 0:
+            usage = {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "execution_time": execution_time
+            }
+        self.db.save_conversation_with_usage(
+            model_name=model_name,
+            prompt=prompt,
+            response=accumulated_text,
+            metadata=metadata,
+            **usage
+        )
+        
+        # Remember the answer for identical future requests; a stream that
+        # failed or was cut off must not be replayed from the cache
+        if cache_key is not None and state.completed and accumulated_text:
+            self.db.put_cached_response(cache_key, accumulated_text, output_tokens, input_tokens + output_tokens)
+    
+    def _save_claude_response(self, response_json, prompt, model_name, stream, max_tokens, start_time, cache_key):
+        """Print and store a non-streaming Claude response"""
+        content = response_json.get("content", [])
+        response_text = ""
+        for block in content:
+            if block.get("type") == "text":
+                text = block.get("text", "")
+                response_text += text
+                print(text)
+        
+        # Print token statistics if available
+        input_tokens = 0
+        output_tokens = 0
+        if "usage" in response_json:
+            usage = response_json["usage"]
+            print("\n--- Token Statistics ---")
+            input_tokens = usage.get('input_tokens', 0)
+            output_tokens = usage.get('output_tokens', 0)
+            print(f"Input tokens: {input_tokens}")
+            print(f"Output tokens: {output_tokens}")
+            if "input_tokens" in usage and "output_tokens" in usage:
+                total = usage["input_tokens"] + usage["output_tokens"]
+                print(f"Total tokens: {total}")
                 
-                # Save token usage if available
-                if input_tokens > 0 or output_tokens > 0:
-                    self.db.save_token_usage(
-                        conversation_id=conversation_id,
-                        input_tokens=input_tokens,
-                        output_tokens=output_tokens,
-                        execution_time=execution_time
-                    )
+        # Save conversation to database
+        metadata = {
+            "stream": stream,
+            "max_tokens": max_tokens,
+            # "reasoning_effort": reasoning_effort  # Claude API不需要此参数
+        }
+        
+        # Calculate execution time
+        execution_time = time.time() - start_time
+        print(f"Execution time: {execution_time:.2f} seconds")
+        
+        # Save the conversation and its token usage in one transaction
+        usage = {}
+        if input_tokens > 0 or output_tokens > 0:
+            usage = {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "execution_time": execution_time
+            }
+        self.db.save_conversation_with_usage(
+            model_name=model_name,
+            prompt=prompt,
+            response=response_text,
+            metadata=metadata,
+            **usage
+        )
+        
+        # Remember the answer for identical future requests
+        if cache_key is not None:
+            self.db.put_cached_response(cache_key, response_text, output_tokens, input_tokens + output_tokens)
@@ -1,3 +1,6 @@
+import asyncio
+import functools
+import inspect
 import requests
 import time
 import threading
@@ -9,8 +12,98 @@ from config import ali_api_key, ali_api_base
 from llm_client import LLMClient
 
 
+# Keeps multi-line summaries from concurrent workers from interleaving
+_print_lock = threading.Lock()
+
+# One client per endpoint/database, shared across requests so the HTTP
+# connection pool and the sqlite connection survive the whole batch
+_clients_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_client(api_base_url, api_key_str, db_path, proxies_key):
+    return LLMClient(api_base_url, api_key_str, dict(proxies_key), db_path)
+
+
+def _get_client(api_base_url, api_key_str, proxies_set, db_path):
+    """Return the shared LLMClient for this endpoint and database, creating it on first use"""
+    # dicts aren't hashable; key the cache on the sorted proxy items instead
+    proxies_key = tuple(sorted((proxies_set or {}).items()))
+    # Lock so concurrent first calls don't each open their own client
+    with _clients_lock:
+        return _cached_client(api_base_url, api_key_str, db_path, proxies_key)
+
+
+# Statuses that mean the request was rejected before running, so a retry
+# cannot duplicate a (billed) completion
+_RETRYABLE_STATUSES = frozenset((429, 503))
+
+
+def _retry_delay(attempt, response=None):
+    """
+    Seconds to wait before the next attempt, or None if the failure is not retryable.
+    
+    Uses full jitter so concurrent workers hitting the same rate limit
+    don't retry in lockstep, and honors a numeric Retry-After header.
+    """
+    backoff = random.uniform(0, min(2 ** attempt, 30))
+    if response is None:
+        return backoff  # Connection error / timeout
+    
+    if response.status_code not in _RETRYABLE_STATUSES:
+        return None
+    
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), backoff)
+        except ValueError:
+            pass  # HTTP-date form; fall back to jittered backoff
+    return backoff
+
+
 def handle_errors(func):
-    """Decorator for error handling and retries"""
+    """
+    Decorator for error handling and retries (sync or async functions).
+    
+    Only failures where the request cannot have reached the model are
+    retried, so a completion is never run (and billed) twice: connect
+    timeouts for sync calls (the session's adapter already retries other
+    connect errors and 429/503), and connect errors plus 429/503 for async
+    calls, honoring Retry-After. Errors while reading a response, such as a
+    stream dropped mid-way, are reported and not retried.
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            import httpx
+            retries = kwargs.pop('retries', 3)
+            
+            for attempt in range(retries):
+                try:
+                    result = await func(*args, **kwargs)
+                    return result if result is not None else True  # Return True for success if None
+                except httpx.HTTPError as e:
+                    print(f"Attempt {attempt + 1} failed for {args[0]}: {str(e)}")
+                    if isinstance(e, httpx.HTTPStatusError):
+                        delay = _retry_delay(attempt, e.response)
+                    elif isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+                        delay = _retry_delay(attempt)  # Never sent
+                    else:
+                        delay = None  # May have been processed already
+                    if delay is None:
+                        print(f"Not retrying {args[0]}: request may have been processed")
+                        return False
+                    if attempt == retries - 1:
+                        print(f"Max retries reached for {args[0]}")
+                        return False
+                    await asyncio.sleep(delay)
+                except Exception as e:
+                    print(f"Unexpected error for {args[0]}: {str(e)}")
+                    return False
+        return async_wrapper
+    
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
         retries = kwargs.pop('retries', 3)
         
@@ -20,55 +113,78 @@ def handle_errors(func):
                 return result if result is not None else True  # Return True for success if None
             except requests.exceptions.RequestException as e:
                 print(f"Attempt {attempt + 1} failed for {args[0]}: {str(e)}")
+                if not isinstance(e, requests.exceptions.ConnectTimeout):
+                    # Statuses were retried by LLMClient's adapter; anything
+                    # else may have failed after the request was processed
+                    print(f"Not retrying {args[0]}: request may have been processed")
+                    return False
+                delay = _retry_delay(attempt)
                 if attempt == retries - 1:
                     print(f"Max retries reached for {args[0]}")
                     return False
-                time.sleep(min(2 ** attempt, 5))  # Exponential backoff
+                time.sleep(delay)
             except Exception as e:
                 print(f"Unexpected error for {args[0]}: {str(e)}")
                 return False
     return wrapper
 
+# Exact model name -> (api_base, api_key, proxies), built once at import
+PROVIDER_ROUTES = {
+    # Silicon Flow API models
+    "Qwen/QwQ-32B": (silicon_flow_api_base, silicon_flow_api_key, {}),
+    # Ali API models
+    "qwq-32b": (ali_api_base, ali_api_key, {}),
+    "qwq-plus-2025-03-05": (ali_api_base, ali_api_key, {}),
+    "deepseek-r1": (ali_api_base, ali_api_key, {}),
+}
+SILICON_FLOW_PREFIX = "deepseek-ai"
+
+
+def _dispatch_by_prefix(model_name):
+    """Route models not listed in PROVIDER_ROUTES"""
+    # deepseek-ai/* on Silicon Flow, except the TA/ hosted variants
+    if SILICON_FLOW_PREFIX in model_name and "TA" not in model_name:
+        return silicon_flow_api_base, silicon_flow_api_key, {}
+    
+    # Default case for all other models
+    return api_base, api_key, proxies
+
+
+def _route(model_name):
+    """Return (api_base, api_key, proxies) for the endpoint serving model_name"""
+    return PROVIDER_ROUTES.get(model_name) or _dispatch_by_prefix(model_name)
+
 @handle_errors
 def process_model_request(model_name, prompt, stream=False, max_tokens=20000, 
-                         thinking=None, reasoning_effort=None, db_path="math.db"):
+                         thinking=None, reasoning_effort=None, db_path="math.db",
+                         use_cache=False):
     """Function to be executed by each thread to process a model request"""
     print(f"\n{'='*50}\nStarting request to model: {model_name}\n{'='*50}")
     
     start_time = time.time()
     
-    # Thread-specific print lock to prevent output interleaving
-    print_lock = threading.Lock()
-    # Handle Silicon Flow API models
-    if (model_name == "Qwen/QwQ-32B" or 
-        ("deepseek-ai" in model_name and "TA" not in model_name)):
-        client = LLMClient(silicon_flow_api_base, silicon_flow_api_key, {}, db_path)
-    
-    # Handle Ali API models
-    elif model_name in ("qwq-32b", "qwq-plus-2025-03-05", "deepseek-r1"):
-        client = LLMClient(ali_api_base, ali_api_key, {}, db_path)
+    api_base_url, api_key_str, proxies_set = _route(model_name)
+    client = _get_client(api_base_url, api_key_str, proxies_set, db_path)
     
-    # Default case for all other models
-    else:
-        client = LLMClient(api_base, api_key, proxies, db_path)
-    
-    # Make the request
-    with print_lock:
-        result = client.make_request(
-            prompt=prompt,
-            model_name=model_name,
-            stream=stream,
-            max_tokens=max_tokens,
-            thinking=thinking,
-            reasoning_effort=reasoning_effort
-        )
+    # Make the request; no lock here so workers' network calls run in parallel
+    result = client.make_request(
+        prompt=prompt,
+        model_name=model_name,
+        stream=stream,
+        max_tokens=max_tokens,
+        thinking=thinking,
+        reasoning_effort=reasoning_effort,
+        use_cache=use_cache
+    )
     
     execution_time = time.time() - start_time
-    print(f"\n{'='*50}\nCompleted request to model: {model_name}")
-    print(f"Execution time: {execution_time:.2f} seconds\n{'='*50}")
-    
-    # Debug print to verify return value
-    print(f"Returning success status for {model_name}")
+    # Hold the print lock only while emitting the summary so it stays contiguous
+    with _print_lock:
+        print(f"\n{'='*50}\nCompleted request to model: {model_name}")
+        print(f"Execution time: {execution_time:.2f} seconds\n{'='*50}")
+        
+        # Debug print to verify return value
+        print(f"Returning success status for {model_name}")
     return True  # Explicitly return True for success
 
 def batch_process_models(models, prompt, max_workers=None, **kwargs):
@@ -96,6 +212,136 @@ def batch_process_models(models, prompt, max_workers=None, **kwargs):
             except Exception as e:
                 print(f"Unexpected error for {model}: {str(e)}")
                 results[model] = False
+            
+            # Report each model as soon as it finishes, not only in the summary
+            with _print_lock:
+                print(f"[{len(results)}/{len(models)}] {model}: {'✓' if results[model] else '✗'}")
+    
+    # Print summary statistics
+    successful = sum(1 for r in results.values() if r)
+    total_time = time.time() - start_time
+    
+    print(f"\n{'='*50}")
+    print("Batch Processing Summary:")
+    print(f"- Total models: {len(models)}")
+    print(f"- Successful: {successful}")
+    print(f"- Failed: {len(models) - successful}")
+    print(f"- Total time: {total_time:.2f} seconds")
+    
+    print("\nModel Results:")
+    for model, success in results.items():
+        print(f"- {model}: {'✓' if success else '✗'}")
+    
+    print('='*50)
+    
+    return results
+
+def _new_async_client(proxies_set, max_connections):
+    """Create an httpx.AsyncClient, using HTTP/2 when the h2 package is installed"""
+    import httpx
+    
+    kwargs = {
+        "limits": httpx.Limits(max_connections=max_connections),
+        "timeout": httpx.Timeout(30.0, read=None),  # streams may idle while the model thinks
+    }
+    proxy = (proxies_set or {}).get("https") or (proxies_set or {}).get("http")
+    if proxy:
+        kwargs["proxy"] = proxy
+    try:
+        return httpx.AsyncClient(http2=True, **kwargs)
+    except ImportError:
+        # h2 not installed; fall back to HTTP/1.1
+        return httpx.AsyncClient(**kwargs)
+
+@handle_errors
+async def aprocess_model_request(model_name, prompt, http_client, stream=False, max_tokens=20000,
+                                 thinking=None, reasoning_effort=None, db_path="math.db",
+                                 use_cache=False):
+    """Coroutine counterpart of process_model_request, sending through http_client"""
+    print(f"\n{'='*50}\nStarting request to model: {model_name}\n{'='*50}")
+    
+    start_time = time.time()
+    
+    api_base_url, api_key_str, proxies_set = _route(model_name)
+    client = _get_client(api_base_url, api_key_str, proxies_set, db_path)
+    
+    result = await client.amake_request(
+        http_client,
+        prompt=prompt,
+        model_name=model_name,
+        stream=stream,
+        max_tokens=max_tokens,
+        thinking=thinking,
+        reasoning_effort=reasoning_effort,
+        use_cache=use_cache
+    )
+    
+    execution_time = time.time() - start_time
+    with _print_lock:
+        print(f"\n{'='*50}\nCompleted request to model: {model_name}")
+        print(f"Execution time: {execution_time:.2f} seconds\n{'='*50}")
+        
+        # Debug print to verify return value
+        print(f"Returning success status for {model_name}")
+    return True  # Explicitly return True for success
+
+async def abatch_process_models(models, prompt, max_concurrency=None, max_connections=50, **kwargs):
+    """
+    Process models concurrently on one event loop with httpx.
+    
+    Unlike batch_process_models there is no thread per request: every
+    request is a coroutine, and requests to the same endpoint share one
+    AsyncClient (multiplexed over a single connection with HTTP/2).
+    Call it from sync code with asyncio.run(abatch_process_models(...)).
+    
+    Args:
+        models: Model names to query
+        prompt: Prompt sent to every model
+        max_concurrency: Maximum requests in flight (default: all at once)
+        max_connections: Connection pool size per endpoint
+        **kwargs: Forwarded to aprocess_model_request
+    
+    Returns:
+        dict: Model name -> success flag
+    """
+    start_time = time.time()
+    semaphore = asyncio.Semaphore(max_concurrency or len(models) or 1)
+    
+    # One AsyncClient per endpoint/proxy combination
+    http_clients = {}
+    for model in models:
+        _, _, proxies_set = _route(model)
+        key = tuple(sorted((proxies_set or {}).items()))
+        if key not in http_clients:
+            http_clients[key] = _new_async_client(proxies_set, max_connections)
+    
+    completed = 0
+    
+    async def run(model):
+        nonlocal completed
+        _, _, proxies_set = _route(model)
+        http_client = http_clients[tuple(sorted((proxies_set or {}).items()))]
+        async with semaphore:
+            result = await aprocess_model_request(model, prompt, http_client, **kwargs)
+        
+        # Report each model as soon as it finishes, not only in the summary
+        completed += 1
+        print(f"[{completed}/{len(models)}] {model}: {'✓' if result else '✗'}")
+        return result
+    
+    try:
+        outcomes = await asyncio.gather(*(run(model) for model in models), return_exceptions=True)
+    finally:
+        for http_client in http_clients.values():
+            await http_client.aclose()
+    
+    results = {}
+    for model, outcome in zip(models, outcomes):
+        if isinstance(outcome, BaseException):
+            print(f"Unexpected error for {model}: {str(outcome)}")
+            results[model] = False
+        else:
+            results[model] = outcome
     
     # Print summary statistics
     successful = sum(1 for r in results.values() if r)
@@ -165,17 +411,23 @@ D. 既不充分也不必要条件"""
 
     random.shuffle(models)
     
-    # Process models with controlled concurrency
-    results = batch_process_models(
+    request_kwargs = dict(
         models=models,
         prompt=prompt,
-        max_workers=5,  # Optimal concurrency level
         stream=True,
         max_tokens=20000,
         thinking=thinking,
         reasoning_effort=reasoning_effort,
         db_path=db_path
     )
+    try:
+        import httpx  # noqa: F401  (optional; only needed for the async path)
+    except ImportError:
+        # Process models with controlled concurrency on worker threads
+        results = batch_process_models(max_workers=5, **request_kwargs)  # Optimal concurrency level
+    else:
+        # Process models with controlled concurrency on a single event loop
+        results = asyncio.run(abatch_process_models(max_concurrency=5, **request_kwargs))
     
     # Print summary statistics
     successful = sum(1 for r in results.values() if r)
@@ -1,3 +1,4 @@
+from collections import ChainMap
 from database import ConversationDB
 from pprint import pprint
 import tiktoken
@@ -17,7 +18,8 @@ exchange_rate = 7.2
 price_USD_converted = {key: (value[0] * exchange_rate, value[1] * exchange_rate) 
                        for key, value in price_USD.items()}
 
-price = {**price_USD_converted, **price_CNY}
+# CNY prices take precedence, as with the former {**USD, **CNY} merge
+price = ChainMap(price_CNY, price_USD_converted)
 
 def main():
     prompt = r"""现在是2025年1月1日00:00，一亿秒之后是什么时候？"""
@@ -28,17 +30,20 @@ def main():
     db = ConversationDB("math.db")
     result = db.search_conversations(prompt)
 
-    for each in result:
+    # Tokenize all responses in one call; tiktoken spreads the batch over threads
+    token_counts = encoder.encode_ordinary_batch([r['response'] for r in result])
+
+    for each, response_tokens in zip(result, token_counts):
         model_name = each['model_name']
         total_output_tokens = each['output_tokens']
         total_time = each["execution_time"]
-        output_tokens = len(encoder.encode(each['response']))
-        if 'reasoning_tokens_info' in each:
-            reasoning_tokens = each["reasoning_tokens_info"]["reasoning_tokens"]
+        output_tokens = len(response_tokens)
+        if each['reasoning_tokens'] is not None:
+            reasoning_tokens = each['reasoning_tokens']
         else:
             reasoning_tokens = total_output_tokens - output_tokens
         reasoning_time = total_time / total_output_tokens * reasoning_tokens
-        fee = input_tokens / 1e6 * price[model_name][0] + total_output_tokens / 1e6 * price[model_name][1]
+        model_price = price.get(model_name)
 
         print()
         print(f"model: {model_name}")
@@ -47,7 +52,11 @@ def main():
             print(f"{reasoning_tokens=}")
             print(f"{reasoning_time=}")
         print(f"{total_time=}")
-        print(f"{fee=} CNY")
+        if model_price is not None:
+            fee = input_tokens / 1e6 * model_price[0] + total_output_tokens / 1e6 * model_price[1]
+            print(f"{fee=} CNY")
+        else:
+            print("price not configured")
         # print(each['response'])
         print()
 
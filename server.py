@@ -7,16 +7,36 @@ pre-stored conversations from a database and streaming them with realistic timin
 
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import StreamingResponse
-import time
+import asyncio
+import codecs
+import functools
 import json
+import os
 import re
+import struct
+import time
+
+# Keep downloaded BPE files in a persistent cache rather than the temp dir
+os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "tiktoken"))
 import tiktoken
 from database import ConversationDB
 
+# orjson parses request bodies and escapes streamed text in C; stdlib fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Initialize FastAPI app and database connection
 app = FastAPI(title="LLM Response Server")
 db = ConversationDB("math.db")
 
+# In-memory indexes over the (read-only) simulation database, filled at startup:
+# (prompt, model_name) -> newest response, and prompt -> [(model_name, response)]
+# newest first for requests whose model name only contains a stored one
+RESPONSE_INDEX = {}
+PROMPT_INDEX = {}
+
 # Define model output speeds (tokens per second)
 MODEL_OUTPUT_SPEEDS = {
     "slow": 15, # Add "slow" to your model name to enable slow mode
@@ -38,8 +58,76 @@ MODEL_OUTPUT_SPEEDS = {
 # Default output speed if model not found in the dictionary
 DEFAULT_OUTPUT_SPEED = 40
 
+# How responses are paced: "approx" estimates tokens from the text (about 4
+# characters per token, one per CJK/full-width character) and never runs the
+# tokenizer; "exact" tokenizes with ENCODER (for verification)
+PACE_MODE = "approx"
+APPROX_CHARS_PER_TOKEN = 4
+
+# East Asian wide/full-width characters, which BPE encodes at about one token each
+_WIDE_CHARS = (
+    "\u1100-\u115f\u2e80-\ua4cf\uac00-\ud7a3\uf900-\ufaff"
+    "\ufe30-\ufe4f\uff00-\uff60\uffe0-\uffe6\U00020000-\U0003fffd"
+)
+_WIDE_CHARS_RE = re.compile(f"[{_WIDE_CHARS}]")
+# Rest of a word cut by a chunk boundary, plus the whitespace after it; wide
+# characters are word boundaries of their own
+_WORD_TAIL_RE = re.compile(f"[^\\s{_WIDE_CHARS}]*\\s?")
+
+# Upper bound on SSE frames per second; faster models pack several tokens per frame
+MAX_FRAMES_PER_SECOND = 60
+
+# Fixed parts of every streamed chunk: data: {"choices":[{"delta":{"content":"..."}}]}
+_SSE_PREFIX = b'data: {"choices":[{"delta":{"content":"'
+_SSE_SUFFIX = b'"}}]}\n\n'
+
+# Binary mode frame: 4-byte big-endian length followed by the UTF-8 content
+_FRAME_HEADER = struct.Struct("!I")
+
+if orjson is not None:
+    def _escape_content(content):
+        """JSON-escape content as UTF-8 bytes, without the surrounding quotes"""
+        return orjson.dumps(content)[1:-1]
+    
+    _loads = orjson.loads
+else:
+    def _escape_content(content):
+        """JSON-escape content as UTF-8 bytes, without the surrounding quotes"""
+        return json.encoder.encode_basestring(content)[1:-1].encode("utf-8")
+    
+    _loads = json.loads
+
 # Initialize tiktoken encoder
+# Loaded once at import: with `gunicorn --preload` the master process loads it
+# and forked workers share it instead of each loading the BPE tables
+_encoder_load_start = time.perf_counter()
 ENCODER = tiktoken.get_encoding("cl100k_base")  # Default encoder for most models
+ENCODER_LOAD_TIME = time.perf_counter() - _encoder_load_start
+_ENCODER_PID = os.getpid()
+
+
+@app.on_event("startup")
+def _log_encoder_status():
+    """Report whether this worker loaded the encoder itself or inherited it."""
+    if os.getpid() == _ENCODER_PID:
+        origin = f"loaded in {ENCODER_LOAD_TIME:.2f}s"
+    else:
+        origin = f"inherited from pid {_ENCODER_PID}"
+    print(f"[pid {os.getpid()}] Encoder {ENCODER.name} ready "
+          f"({ENCODER.n_vocab} tokens, {origin})")
+
+
+@app.on_event("startup")
+def _build_response_index():
+    """Load every stored conversation into RESPONSE_INDEX and PROMPT_INDEX."""
+    RESPONSE_INDEX.clear()
+    PROMPT_INDEX.clear()
+    for conv in db.iter_conversations(limit=None):
+        key = (conv['prompt'], conv['model_name'])
+        # Rows arrive newest first; keep the first response seen per key
+        if key not in RESPONSE_INDEX:
+            RESPONSE_INDEX[key] = conv['response']
+            PROMPT_INDEX.setdefault(conv['prompt'], []).append((conv['model_name'], conv['response']))
 
 
 @app.post('/chat/completions')
@@ -57,13 +145,15 @@ async def chat_completions(request: Request):
         HTTPException: If the requested model and prompt combination is not found
     """
     # Parse request data
-    data = await request.json()
+    data = _loads(await request.body())
     prompt = data['messages'][0]['content']
     model_name = data['model']
     
     # Extract optional parameters
     debug_mode = data.get('debug_mode', False)
-    smoothing_factor = data.get('smoothing_factor', 0.7)  # 0-1, higher = smoother timing
+    pace_mode = data.get('pace_mode', PACE_MODE)  # "approx" or "exact"
+    # ?binary=1: length-prefixed UTF-8 frames instead of SSE, for local clients
+    binary = request.query_params.get('binary') in ('1', 'true')
 
     # Find matching conversation in database
     response_text = await _find_matching_response(prompt, model_name)
@@ -74,9 +164,10 @@ async def chat_completions(request: Request):
             response_text, 
             model_name, 
             debug_mode=debug_mode,
-            smoothing_factor=smoothing_factor
+            pace_mode=pace_mode,
+            binary=binary
         ),
-        media_type='text/event-stream'
+        media_type='application/octet-stream' if binary else 'text/event-stream'
     )
 
 
@@ -94,132 +185,248 @@ async def _find_matching_response(prompt, model_name):
     Raises:
         HTTPException: If no matching conversation is found
     """
-    # Query the database for the prompt
-    conversations = db.search_conversations(query=prompt)
+    # Exact prompt and model name
+    response = RESPONSE_INDEX.get((prompt, model_name))
+    if response is not None:
+        return response
+    
+    # Exact prompt, stored model name contained in the requested one
+    for stored_model, response in PROMPT_INDEX.get(prompt, ()):
+        if stored_model in model_name:
+            return response
     
-    # Filter conversations by model name
-    matching_conversations = [
-        conv for conv in conversations if (conv['model_name'] in model_name)
-    ]
+    # Not indexed (partial prompt or added after startup): query the database
+    # in a worker thread so the event loop keeps serving other streams
+    conversation = await asyncio.to_thread(db.search_conversations_for_model, prompt, model_name)
 
-    if not matching_conversations:
+    if conversation is None:
         raise HTTPException(
             status_code=404, 
             detail="Model and prompt not found in database"
         )
 
-    # Return the response from the first matching conversation
-    return matching_conversations[0]['response']
+    return conversation['response']
 
 
-async def _generate_streaming_response(
+def _generate_streaming_response(
     response_text, 
     model_name, 
     debug_mode=False, 
-    smoothing_factor=0.7
+    pace_mode=PACE_MODE,
+    binary=False
 ):
     """
-    Generate a streaming response that simulates an LLM output with dynamic timing.
+    Generate a streaming response that simulates an LLM output with scheduled timing.
+    
+    The flags are fixed for the whole stream, so they are resolved once here
+    and the matching loop is returned: a tight one, or one with diagnostics.
     
     Args:
         response_text (str): The full response text to stream
         model_name (str): The model name to determine output speed
         debug_mode (bool): Whether to log timing information
-        smoothing_factor (float): 0-1, higher values produce smoother timing adjustments
+        pace_mode (str): "approx" to estimate token counts from text length,
+            "exact" to tokenize the response
+        binary (bool): Emit length-prefixed frames instead of SSE messages
         
-    Yields:
-        str: Chunks of the response in SSE format
+    Returns:
+        AsyncIterator[bytes]: Chunks of the response in SSE (or binary) format
     """
     # Get the output speed for the model (tokens per second)
-    output_speed = MODEL_OUTPUT_SPEEDS.get(model_name, DEFAULT_OUTPUT_SPEED)
-    if "slow" in model_name:
-        output_speed = MODEL_OUTPUT_SPEEDS["slow"]
+    output_speed = _resolve_speed(model_name)
     
-    # Initialize timing variables
-    start_time = time.time()
-    tokens_sent = 0
-    tokens = ENCODER.encode(response_text)
-    total_tokens = len(tokens)
-    last_delay = 0  # Track the last delay for smoothing
+    # Coalesce tokens so frames go out no faster than clients can render them;
+    # slow models still get one token per frame
+    chunk_size = max(1, int(output_speed / MAX_FRAMES_PER_SECOND))
+    if pace_mode == "exact":
+        tokens = _encode_cached(response_text)
+        total_tokens = len(tokens)
+        chunks = _iter_token_chunks(tokens, chunk_size)
+    else:
+        total_tokens = max(1, int(_approx_tokens(response_text)))
+        chunks = _iter_text_chunks(response_text, chunk_size)
+    
+    format_message = _format_binary_message if binary else _format_sse_message
     
     if debug_mode:
         print(f"Starting response generation for model: {model_name}")
         print(f"Target output speed: {output_speed} tokens/second")
         print(f"Estimated total tokens: {total_tokens}")
+        return _stream_debug(chunks, output_speed, format_message)
+    return _stream_fast(chunks, output_speed, format_message)
+
+
+async def _stream_fast(chunks, output_speed, format_message):
+    """
+    Emit chunks on schedule with no diagnostics.
     
-    # Process the text token by token
-    token_buffer = []
-    i = 0
+    Chunk k is due at start + (tokens before it) / output_speed; the
+    schedule is smooth by construction, so no feedback smoothing is needed.
     
-    while i < len(tokens):
-        # Calculate expected progress based on elapsed time
-        elapsed_time = time.time() - start_time
-        expected_tokens = elapsed_time * output_speed
-        
-        # Calculate timing adjustment
-        if tokens_sent > expected_tokens:
-            # We're ahead of schedule, slow down
-            tokens_ahead = tokens_sent - expected_tokens
-            raw_delay = tokens_ahead / output_speed
-            
-            # Apply smoothing to prevent abrupt changes in timing
-            dynamic_delay = (smoothing_factor * last_delay) + ((1 - smoothing_factor) * raw_delay)
-            
-            # Apply delay with a minimum to prevent too short sleeps
-            actual_delay = max(dynamic_delay, 0)
-            time.sleep(actual_delay)
-            last_delay = actual_delay
-            
-            if debug_mode and tokens_sent % 10 == 0:
-                print(f"Ahead by {tokens_ahead:.1f} tokens, sleeping for {actual_delay:.3f}s")
-                
-        elif tokens_sent < expected_tokens - 2:  # Small buffer to prevent oscillation
-            # We're behind schedule, try to catch up by processing more tokens before next delay
-            # This is handled implicitly by not adding delays
-            if debug_mode and tokens_sent % 10 == 0:
-                tokens_behind = expected_tokens - tokens_sent
-                print(f"Behind by {tokens_behind:.1f} tokens, catching up...")
+    Args:
+        chunks (Iterable[tuple]): (text, token_count) pairs
+        output_speed (float): Tokens per second
+        format_message (Callable): Turns chunk text into a wire frame
         
-        # Get the next token
-        if i < len(tokens):
-            token_id = tokens[i]
-            i += 1
-            
-            # Add token to buffer
-            token_buffer.append(token_id)
-            
-            # Try to decode the buffer
-            try:
-                chunk_text = ENCODER.decode(token_buffer, "strict")
-                yield _format_sse_message(chunk_text)
-                tokens_sent += len(token_buffer)
-                token_buffer = []
-            except UnicodeDecodeError:
-                continue
+    Yields:
+        bytes: Chunks of the response in SSE format
+    """
+    # Monotonic event-loop clock for pacing
+    clock = asyncio.get_running_loop().time
+    sleep = asyncio.sleep
+    start_time = clock()
+    tokens_sent = 0
+    
+    for chunk_text, chunk_tokens in chunks:
+        delay = start_time + tokens_sent / output_speed - clock()
+        if delay > 0:
+            # Yield to the event loop so other streams keep running meanwhile
+            await sleep(delay)
+        tokens_sent += chunk_tokens
+        if chunk_text:
+            yield format_message(chunk_text)
 
+
+async def _stream_debug(chunks, output_speed, format_message):
+    """
+    Same schedule as _stream_fast, logging lag and final statistics.
     
-    # Send any remaining tokens
-    if token_buffer:
-        try:
-            final_chunk = ENCODER.decode(token_buffer)
-            yield _format_sse_message(final_chunk)
-            tokens_sent += len(token_buffer)
-        except Exception as e:
-            if debug_mode:
-                print(f"Error decoding final tokens: {e}")
+    Args:
+        chunks (Iterable[tuple]): (text, token_count) pairs
+        output_speed (float): Tokens per second
+        format_message (Callable): Turns chunk text into a wire frame
+        
+    Yields:
+        bytes: Chunks of the response in SSE format
+    """
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    tokens_sent = 0
     
-    # Log progress for debugging
-    if debug_mode and tokens_sent % 20 == 0:
-        print(f"Progress: {tokens_sent}/{total_tokens} tokens ({tokens_sent/total_tokens*100:.1f}%), " 
-              f"Time: {elapsed_time:.2f}s, Expected: {expected_tokens:.1f} tokens")
+    for chunk_text, chunk_tokens in chunks:
+        delay = start_time + tokens_sent / output_speed - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif delay < -0.1:
+            print(f"Behind schedule by {-delay:.3f}s at {tokens_sent:.0f} tokens")
+        
+        tokens_sent += chunk_tokens
+        if chunk_text:
+            yield format_message(chunk_text)
     
     # Log final statistics
-    if debug_mode:
-        final_time = time.time() - start_time
-        print(f"\nResponse complete:")
-        print(f"Total tokens: {tokens_sent}")
-        print(f"Total time: {final_time:.2f}s")
-        print(f"Average speed: {tokens_sent/final_time:.1f} tokens/second")
+    final_time = loop.time() - start_time
+    print(f"\nResponse complete:")
+    print(f"Total tokens: {tokens_sent}")
+    print(f"Total time: {final_time:.2f}s")
+    print(f"Average speed: {tokens_sent/final_time:.1f} tokens/second")
+
+
+def _iter_token_chunks(tokens, chunk_size):
+    """
+    Split token ids into text chunks of chunk_size tokens.
+    
+    Each chunk is decoded with one decode_bytes call; bytes of a character
+    split across a chunk boundary are carried over to the next chunk.
+    
+    Args:
+        tokens (tuple): Token ids of the response
+        chunk_size (int): Tokens per chunk
+        
+    Yields:
+        tuple: (text, token_count) for each chunk; text may be empty
+    """
+    utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+    for i in range(0, len(tokens), chunk_size):
+        chunk = tokens[i:i + chunk_size]
+        yield utf8_decoder.decode(ENCODER.decode_bytes(chunk)), len(chunk)
+    yield utf8_decoder.decode(b"", final=True), 0
+
+
+def _approx_tokens(text):
+    """
+    Estimate the token count of text without tokenizing.
+    
+    Wide (CJK/full-width) characters count as one token each, everything
+    else as APPROX_CHARS_PER_TOKEN characters per token.
+    
+    Args:
+        text (str): The text to estimate
+        
+    Returns:
+        float: Estimated token count
+    """
+    if text.isascii():
+        return len(text) / APPROX_CHARS_PER_TOKEN
+    wide = len(_WIDE_CHARS_RE.findall(text))
+    return wide + (len(text) - wide) / APPROX_CHARS_PER_TOKEN
+
+
+def _iter_text_chunks(text, chunk_size):
+    """
+    Split text into chunks of roughly chunk_size tokens without tokenizing.
+    
+    Chunks start at APPROX_CHARS_PER_TOKEN characters per token, are shortened
+    when wide characters push the estimate over chunk_size, and end at a word
+    boundary: cut back to the last space or newline when there is one, else
+    extended to the end of the word (the estimate follows the chunk).
+    
+    Args:
+        text (str): The response text
+        chunk_size (int): Approximate tokens per chunk
+        
+    Yields:
+        tuple: (text, estimated_token_count) for each chunk
+    """
+    chunk_chars = chunk_size * APPROX_CHARS_PER_TOKEN
+    pos = 0
+    while pos < len(text):
+        end = pos + chunk_chars
+        estimate = _approx_tokens(text[pos:end])
+        if estimate > chunk_size:
+            # Dense (e.g. CJK) text: keep the chunk near chunk_size tokens
+            end = pos + max(1, int(chunk_chars * chunk_size / estimate))
+        if end < len(text):
+            # Prefer to break right after whitespace
+            brk = max(text.rfind(" ", pos + 1, end), text.rfind("\n", pos + 1, end))
+            if brk != -1:
+                end = brk + 1
+            else:
+                # No whitespace in the window: finish the word it cut into
+                end = _WORD_TAIL_RE.match(text, end).end()
+        piece = text[pos:end]
+        pos = end
+        yield piece, _approx_tokens(piece)
+
+
+@functools.lru_cache(maxsize=256)
+def _resolve_speed(model_name):
+    """
+    Resolve the output speed for a model name, memoized per name.
+    
+    Args:
+        model_name (str): The requested model name
+        
+    Returns:
+        float: Output speed in tokens per second
+    """
+    if "slow" in model_name:
+        return MODEL_OUTPUT_SPEEDS["slow"]
+    return MODEL_OUTPUT_SPEEDS.get(model_name, DEFAULT_OUTPUT_SPEED)
+
+
+@functools.lru_cache(maxsize=1024)
+def _encode_cached(text):
+    """
+    Tokenize text, memoized so each stored response is encoded at most once.
+    
+    Args:
+        text (str): The text to tokenize
+        
+    Returns:
+        tuple: Token ids (a tuple, so cached results can't be mutated)
+    """
+    return tuple(ENCODER.encode(text))
 
 
 def _get_token_count(text):
@@ -232,26 +439,34 @@ def _get_token_count(text):
     Returns:
         int: Exact token count
     """
-    return len(ENCODER.encode(text))
+    return len(_encode_cached(text))
 
 
 def _format_sse_message(content):
     """
     Format content as a Server-Sent Events (SSE) message.
     
+    Only the content string is JSON-escaped; the fixed envelope around it
+    is pre-encoded in _SSE_PREFIX/_SSE_SUFFIX.
+    
     Args:
         content (str): The content to include in the message
         
     Returns:
-        str: Formatted SSE message
+        bytes: Formatted SSE message
+    """
+    return _SSE_PREFIX + _escape_content(content) + _SSE_SUFFIX
+
+
+def _format_binary_message(content):
+    """
+    Format content as a length-prefixed binary frame.
+    
+    Args:
+        content (str): The content to include in the frame
+        
+    Returns:
+        bytes: 4-byte big-endian length followed by the UTF-8 content
     """
-    data = {
-        'choices': [
-            {
-                'delta': {
-                    'content': content
-                }
-            }
-        ]
-    }
-    return f"data: {json.dumps(data)}\n\n"
+    data = content.encode("utf-8")
+    return _FRAME_HEADER.pack(len(data)) + data
@@ -1,76 +1,163 @@
 import argparse
 import sys
+import unicodedata
 from database import ConversationDB
-from tabulate import tabulate
 import json
 
+# Line breaks and tabs dropped from truncated table cells
+_DROP_NL = str.maketrans("", "", "\n\r\t")
+
 def format_text(text, max_length=20, truncate_from='start'):
     """Format text for display by truncating if too long.
     Truncate from 'start' (beginning) or 'end'."""
     if not text:
         return ""
-    if len(text) > max_length:
-        if truncate_from == 'start':
-            return text[:max_length].replace("\n","") + "..."
-        elif truncate_from == 'end':
-            return "..." + text[-max_length:].replace("\n","")
+    if len(text) <= max_length:
+        return text
+    if truncate_from == 'start':
+        return text[:max_length].translate(_DROP_NL) + "..."
+    if truncate_from == 'end':
+        return "..." + text[-max_length:].translate(_DROP_NL)
     return text
 
-def view_all_conversations(db, limit=20, offset=0, detailed=False):
-    """Display all conversations with pagination"""
-    conversations = db.get_all_conversations(limit=limit, offset=offset)
+def _display_width(text):
+    """Terminal width of text; CJK (wide/fullwidth) characters take two columns."""
+    if text.isascii():
+        return len(text)
+    return sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text)
+
+def _format_table(rows, headers, tablefmt="grid"):
+    """Render rows as a "grid" or "simple" text table, as tabulate would.
+    Numeric cells are right-aligned, everything else left-aligned;
+    cells containing newlines span several lines."""
+    cells = [[str(value).split("\n") for value in row] for row in rows]
+    numeric = [
+        all(isinstance(row[col], (int, float)) for row in rows) if rows else False
+        for col in range(len(headers))
+    ]
+    widths = [_display_width(header) for header in headers]
+    for row in cells:
+        for col, cell in enumerate(row):
+            widths[col] = max(widths[col], *map(_display_width, cell))
     
-    if not conversations:
-        print("No conversations found.")
-        return
+    def pad(text, col):
+        fill = " " * (widths[col] - _display_width(text))
+        return fill + text if numeric[col] else text + fill
+    
+    def row_lines(row, left, sep, right):
+        height = max(len(cell) for cell in row)
+        return [
+            left + sep.join(pad(cell[i] if i < len(cell) else "", c) for c, cell in enumerate(row)) + right
+            for i in range(height)
+        ]
+    
+    lines = []
+    if tablefmt == "grid":
+        border = "+" + "+".join("-" * (w + 2) for w in widths) + "+"
+        lines.append(border)
+        lines += row_lines([[h] for h in headers], "| ", " | ", " |")
+        lines.append("+" + "+".join("=" * (w + 2) for w in widths) + "+")
+        for row in cells:
+            lines += row_lines(row, "| ", " | ", " |")
+            lines.append(border)
+    else:
+        lines += row_lines([[h] for h in headers], "", "  ", "")
+        lines.append("  ".join("-" * w for w in widths))
+        for row in cells:
+            lines += row_lines(row, "", "  ", "")
+    return "\n".join(lines)
+
+_CELL_WIDTH = 20  # same as format_text's default max_length
+
+def _table_row(conv):
+    """Summary table row for a conversation.
+    Prompt/response truncation is format_text inlined for the two fixed cases."""
+    prompt = conv['prompt'] or ""
+    response = conv['response'] or ""
+    return [
+        conv['id'],
+        conv['model_name'],
+        conv['timestamp'],
+        prompt if len(prompt) <= _CELL_WIDTH else prompt[:_CELL_WIDTH].translate(_DROP_NL) + "...",
+        response if len(response) <= _CELL_WIDTH else "..." + response[-_CELL_WIDTH:].translate(_DROP_NL),
+        f"{conv.get('input_tokens', 'N/A')} / {conv.get('output_tokens', 'N/A')}",
+        f"{conv.get('execution_time', 'N/A'):.2f}s" if conv.get('execution_time') else 'N/A'
+    ]
+
+_TABLE_HEADERS = ["ID", "Model", "Timestamp", "Prompt", "Response", "Tokens (In/Out)", "Time"]
+_TABLE_BATCH = 100  # rows rendered per table when streaming
+
+def _conversation_lines(conv, title, prompt, response):
+    """Lines of the detailed view of a conversation"""
+    lines = [
+        f"\n=== {title} ===",
+        f"Model: {conv['model_name']}",
+        f"Time: {conv['timestamp']}",
+        f"Input tokens: {conv.get('input_tokens', 'N/A')}",
+        f"Output tokens: {conv.get('output_tokens', 'N/A')}",
+        f"Total tokens: {conv.get('total_tokens', 'N/A')}",
+        f"Execution time: {conv.get('execution_time', 'N/A')} seconds",
+    ]
+    
+    # Display reasoning tokens info if available
+    if conv.get('reasoning_tokens') is not None:
+        lines += [
+            "\nReasoning tokens info:",
+            f"  Reasoning tokens: {conv['reasoning_tokens']}",
+            f"  Accepted prediction tokens: {conv.get('accepted_prediction_tokens', 'N/A')}",
+            f"  Rejected prediction tokens: {conv.get('rejected_prediction_tokens', 'N/A')}",
+        ]
+    
+    lines += ["\nPrompt:", prompt, "\nResponse:", response]
+    
+    if conv['metadata']:
+        lines.append("\nMetadata:")
+        lines += [f"  {key}: {value}" for key, value in conv['metadata'].items()]
+    return lines
+
+def _write_lines(lines):
+    """Write lines to stdout with a single write() call"""
+    sys.stdout.write("\n".join(lines) + "\n")
+
+def view_all_conversations(db, limit=20, offset=0, detailed=False):
+    """Display all conversations with pagination.
+    Rows are streamed from the database rather than loaded all at once,
+    and output is written one batch of conversations at a time."""
+    count = 0
     
     if detailed:
-        for i, conv in enumerate(conversations):
-            print(f"\n=== Conversation {offset + i + 1} (ID: {conv['id']}) ===")
-            print(f"Model: {conv['model_name']}")
-            print(f"Time: {conv['timestamp']}")
-            print(f"Input tokens: {conv.get('input_tokens', 'N/A')}")
-            print(f"Output tokens: {conv.get('output_tokens', 'N/A')}")
-            print(f"Total tokens: {conv.get('total_tokens', 'N/A')}")
-            print(f"Execution time: {conv.get('execution_time', 'N/A')} seconds")
-            
-            # Display reasoning tokens info if available
-            if 'reasoning_tokens_info' in conv:
-                print("\nReasoning tokens info:")
-                info = conv['reasoning_tokens_info']
-                print(f"  Reasoning tokens: {info.get('reasoning_tokens', 'N/A')}")
-                print(f"  Accepted prediction tokens: {info.get('accepted_prediction_tokens', 'N/A')}")
-                print(f"  Rejected prediction tokens: {info.get('rejected_prediction_tokens', 'N/A')}")
-            
-            print("\nPrompt:")
-            print(conv['prompt'])
-            print("\nResponse:")
-            print(conv['response'])
-            
-            if conv['metadata']:
-                print("\nMetadata:")
-                for key, value in conv['metadata'].items():
-                    print(f"  {key}: {value}")
-            
-            print("\n" + "=" * 80)
+        parts = []
+        for i, conv in enumerate(db.iter_conversations(limit=limit, offset=offset)):
+            count += 1
+            parts += _conversation_lines(
+                conv, f"Conversation {offset + i + 1} (ID: {conv['id']})", conv['prompt'], conv['response']
+            )
+            parts.append("\n" + "=" * 80)
+            if count % _TABLE_BATCH == 0:
+                _write_lines(parts)
+                parts = []
+        if parts:
+            _write_lines(parts)
+        
+        if not count:
+            print("No conversations found.")
     else:
-        # Create a simplified table view
+        # Simplified table view, printed one batch of rows at a time
         table_data = []
-        for conv in conversations:
-            table_data.append([
-                conv['id'],
-                conv['model_name'],
-                conv['timestamp'],
-                format_text(conv['prompt'], truncate_from='start'),
-                format_text(conv['response'], truncate_from='end'),
-                f"{conv.get('input_tokens', 'N/A')} / {conv.get('output_tokens', 'N/A')}",
-                f"{conv.get('execution_time', 'N/A'):.2f}s" if conv.get('execution_time') else 'N/A'
-            ])
+        for conv in db.iter_conversations(limit=limit, offset=offset):
+            count += 1
+            table_data.append(_table_row(conv))
+            if len(table_data) == _TABLE_BATCH:
+                _write_lines([_format_table(table_data, _TABLE_HEADERS, tablefmt="grid")])
+                table_data = []
+        if table_data:
+            _write_lines([_format_table(table_data, _TABLE_HEADERS, tablefmt="grid")])
         
-        headers = ["ID", "Model", "Timestamp", "Prompt", "Response", "Tokens (In/Out)", "Time"]
-        print(tabulate(table_data, headers=headers, tablefmt="grid"))
+        if not count:
+            print("No conversations found.")
+            return
         
-        print(f"\nShowing conversations {offset+1}-{offset+len(conversations)}. Use --offset to see more.")
+        print(f"\nShowing conversations {offset+1}-{offset+count}. Use --offset to see more.")
 
 def view_conversation(db, conversation_id):
     """Display a single conversation in detail"""
@@ -80,32 +167,12 @@ def view_conversation(db, conversation_id):
         print(f"Conversation with ID {conversation_id} not found.")
         return
     
-    print(f"\n=== Conversation {conv['id']} ===")
-    print(f"Model: {conv['model_name']}")
-    print(f"Time: {conv['timestamp']}")
-    print(f"Input tokens: {conv.get('input_tokens', 'N/A')}")
-    print(f"Output tokens: {conv.get('output_tokens', 'N/A')}")
-    print(f"Total tokens: {conv.get('total_tokens', 'N/A')}")
-    print(f"Execution time: {conv.get('execution_time', 'N/A')} seconds")
-    
-    # Display reasoning tokens info if available
-    if 'reasoning_tokens_info' in conv:
-        print("\nReasoning tokens info:")
-        info = conv['reasoning_tokens_info']
-        print(f"  Reasoning tokens: {info.get('reasoning_tokens', 'N/A')}")
-        print(f"  Accepted prediction tokens: {info.get('accepted_prediction_tokens', 'N/A')}")
-        print(f"  Rejected prediction tokens: {info.get('rejected_prediction_tokens', 'N/A')}")
-    
-    print("\nPrompt:")
-    print(format_text(conv['prompt'], truncate_from='start'))
-    
-    print("\nResponse:")
-    print(format_text(conv['response'], truncate_from='end'))
-    
-    if conv['metadata']:
-        print("\nMetadata:")
-        for key, value in conv['metadata'].items():
-            print(f"  {key}: {value}")
+    _write_lines(_conversation_lines(
+        conv,
+        f"Conversation {conv['id']}",
+        format_text(conv['prompt'], truncate_from='start'),
+        format_text(conv['response'], truncate_from='end'),
+    ))
 
 def search_conversations(db, query, limit=20, offset=0):
     """Search for conversations containing the query"""
@@ -116,20 +183,8 @@ def search_conversations(db, query, limit=20, offset=0):
         return
     
     # Create a simplified table view
-    table_data = []
-    for conv in conversations:
-        table_data.append([
-            conv['id'],
-            conv['model_name'],
-            conv['timestamp'],
-            format_text(conv['prompt'], truncate_from='start'),
-            format_text(conv['response'], truncate_from='end'),
-            f"{conv.get('input_tokens', 'N/A')} / {conv.get('output_tokens', 'N/A')}",
-            f"{conv.get('execution_time', 'N/A'):.2f}s" if conv.get('execution_time') else 'N/A'
-        ])
-    
-    headers = ["ID", "Model", "Timestamp", "Prompt", "Response", "Tokens (In/Out)", "Time"]
-    print(tabulate(table_data, headers=headers, tablefmt="grid"))
+    table_data = [_table_row(conv) for conv in conversations]
+    print(_format_table(table_data, _TABLE_HEADERS, tablefmt="grid"))
     
     print(f"\nFound {len(conversations)} conversations matching '{query}'.")
 
@@ -152,7 +207,7 @@ def view_stats(db):
             ])
         
         headers = ["Model", "Input Tokens", "Output Tokens", "Total Tokens"]
-        print(tabulate(table_data, headers=headers, tablefmt="simple"))
+        print(_format_table(table_data, headers, tablefmt="simple"))
     
     if stats['conversations_by_date']:
         print("\nConversations by date (last 30 days):")
@@ -164,7 +219,7 @@ def view_stats(db):
             ])
         
         headers = ["Date", "Count"]
-        print(tabulate(table_data, headers=headers, tablefmt="simple"))
+        print(_format_table(table_data, headers, tablefmt="simple"))
 
 def main():
     parser = argparse.ArgumentParser(description="View and manage LLM conversations")